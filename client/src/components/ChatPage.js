@@ -86,6 +86,10 @@ export default function ChatPage({ token }) {
             const res = await api.post('/ai/chat', {
                 prompt,
                 persona: AI_PERSONAS.find(p => p.id === selectedPersona).prompt
+            }, {
+                headers: {
+                    'token': token
+                }
             });
             logger.debug("Chat response:", res.data);
             const aiReply = { id: uuidv4(), sender: 'ai', content: res.data.reply };
@@ -0,0 +1,424 @@
+# server/ai_gateway.py
+# Gateway between the AI routes and the OpenAI-compatible upstream.
+#
+# Each model is a "lane" with its own input-token budget, concurrency semaphore
+# and circuit breaker. Requests are routed by task and prompt size: short
+# prompts go to AI_FAST_MODEL, long ones to AI_LARGE_MODEL. If the preferred
+# lane's breaker is open, the request falls back to the other lane when the
+# prompt fits there. Prompts are trimmed to the chosen lane's budget. Plan
+# summaries are packed many plans per upstream call. The routes run in the
+# threadpool, so the semaphores cap how many worker threads can wait on a
+# slow model; callers that cannot get a slot within AI_ACQUIRE_TIMEOUT_SECONDS
+# get a 503 instead of queueing. Point OPENAI_BASE_URL at
+# benchmarks/fake_openai.py to exercise all of this locally.
+
+import json
+import math
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import openai
+import logging
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    AI_FAST_MODEL,
+    AI_LARGE_MODEL,
+    AI_FAST_MAX_INPUT_TOKENS,
+    AI_LARGE_MAX_INPUT_TOKENS,
+    AI_FAST_CONCURRENCY,
+    AI_LARGE_CONCURRENCY,
+    AI_LARGE_PROMPT_TOKENS,
+    AI_CHAT_MAX_TOKENS,
+    AI_SUMMARY_BATCH_MAX_PLANS,
+    AI_SUMMARY_PLAN_TOKENS,
+    AI_REQUEST_TIMEOUT_SECONDS,
+    AI_MAX_RETRIES,
+    AI_ACQUIRE_TIMEOUT_SECONDS,
+    AI_BREAKER_FAILURES,
+    AI_BREAKER_RESET_SECONDS,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+FAST = "fast"
+LARGE = "large"
+CHAT_SYSTEM_PROMPT = "You are a helpful assistant."
+SUMMARY_SYSTEM_PROMPT = (
+    "You summarize a user's plans. Each input line is '<id>: <plan>'. "
+    "Reply with a JSON object {\"summaries\": [{\"id\": <id>, \"summary\": \"<one short sentence>\"}]} "
+    "containing every id exactly once."
+)
+SUMMARY_TOKENS_PER_PLAN = 60  # Output allowance per plan in a batch
+TRIM_MARKER = "\n[...]\n"
+
+# Upstream errors that mean the model is unhealthy (as opposed to a bad request).
+# APITimeoutError is a subclass of APIConnectionError.
+BREAKER_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class GatewayError(Exception):
+    """A request the gateway refused or could not complete; maps to an HTTP error."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken when installed, otherwise ~4 characters per token."""
+
+    def __init__(self, model: str = AI_FAST_MODEL):
+        self._encoding = None
+        try:
+            import tiktoken  # Optional dependency for exact counts
+
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            logger.info("tiktoken is not installed; estimating token counts from text length.")
+        except Exception as e:
+            # tiktoken downloads encodings on first use and may be offline.
+            logger.warning(f"tiktoken unavailable ({e}); estimating token counts from text length.")
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return math.ceil(len(text) / 4)
+
+    def count_messages(self, messages: List[dict]) -> int:
+        # Chat formatting adds a few tokens per message and for the reply primer.
+        return sum(self.count(m["content"]) + 4 for m in messages) + 3
+
+    def trim(self, text: str, max_tokens: int) -> str:
+        """Shorten text to about max_tokens, keeping the start and the end."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(max_tokens - self.count(TRIM_MARKER), 1)
+        head = keep * 2 // 3
+        tail = keep - head
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text)
+            return (self._encoding.decode(tokens[:head]) + TRIM_MARKER
+                    + (self._encoding.decode(tokens[-tail:]) if tail else ""))
+        return text[:head * 4] + TRIM_MARKER + (text[-tail * 4:] if tail else "")
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive upstream failures.
+
+    After `reset_seconds` one probe request is let through (half-open); its
+    result closes or re-opens the breaker.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures: int = AI_BREAKER_FAILURES, reset_seconds: float = AI_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[str]:
+        """Return "closed" or "probe" if a request may go upstream, else None."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return "closed"
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return "probe"
+            return None
+
+    def cancel_probe(self):
+        """Give back a probe that never reached the upstream."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return max(1, math.ceil(self.reset_seconds - (time.monotonic() - self.opened_at)))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("AI circuit breaker closed.")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"AI circuit breaker opened after {self.consecutive_failures} failures.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ModelLane:
+    def __init__(self, tier: str, model: str, max_input_tokens: int, concurrency: int,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.tier = tier
+        self.model = model
+        self.max_input_tokens = max_input_tokens
+        self.concurrency = concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.metrics = {
+            "calls": 0,
+            "failures": 0,
+            "rejected_busy": 0,
+            "rejected_open": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    def _count(self, metric: str, amount: int = 1):
+        with self._lock:
+            self.metrics[metric] += amount
+
+    def call(self, create: Callable, acquire_timeout: float, probe: bool = False):
+        """Run one upstream call under this lane's semaphore and breaker.
+
+        The breaker is checked by the caller (see AIGateway._pick_lane); probe
+        says whether that check granted the half-open probe.
+        """
+        if not self._slots.acquire(timeout=acquire_timeout):
+            self._count("rejected_busy")
+            if probe:
+                self.breaker.cancel_probe()
+            raise GatewayError(503, f"AI model {self.model} is busy, please retry", retry_after=1)
+        with self._lock:
+            self.in_flight += 1
+            self.metrics["calls"] += 1
+        try:
+            response = create(self.model)
+        except BREAKER_ERRORS:
+            self._count("failures")
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # The upstream answered (e.g. 400/404); it is healthy.
+            self.breaker.record_success()
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+        self.breaker.record_success()
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self._count("prompt_tokens", usage.prompt_tokens or 0)
+            self._count("completion_tokens", usage.completion_tokens or 0)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self.metrics)
+            data.update({
+                "model": self.model,
+                "in_flight": self.in_flight,
+                "concurrency": self.concurrency,
+                "max_input_tokens": self.max_input_tokens,
+                "breaker": self.breaker.state,
+            })
+            return data
+
+
+class AIGateway:
+    def __init__(self, fast: ModelLane, large: ModelLane, counter: Optional[TokenCounter] = None,
+                 client=None, large_prompt_tokens: int = AI_LARGE_PROMPT_TOKENS,
+                 acquire_timeout: float = AI_ACQUIRE_TIMEOUT_SECONDS):
+        self.lanes = {FAST: fast, LARGE: large}
+        self.counter = counter or TokenCounter(fast.model)
+        self.large_prompt_tokens = large_prompt_tokens
+        self.acquire_timeout = acquire_timeout
+        self._client = client
+        self._client_lock = threading.Lock()
+        self._metrics = {"trimmed_prompts": 0, "fallbacks": 0, "summary_batches": 0, "summary_plans": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, metric: str, amount: int = 1):
+        with self._lock:
+            self._metrics[metric] += amount
+
+    @property
+    def client(self):
+        # Built on first use so importing this module never needs credentials.
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(
+                        api_key=OPENAI_API_KEY,
+                        base_url=OPENAI_BASE_URL or None,
+                        timeout=AI_REQUEST_TIMEOUT_SECONDS,
+                        max_retries=AI_MAX_RETRIES,
+                    )
+        return self._client
+
+    # Routing -----------------------------------------------------------------
+
+    def route(self, prompt_tokens: int, tier: Optional[str] = None) -> List[ModelLane]:
+        """Lanes to try in order: the preferred one, then a fallback that fits the prompt."""
+        if tier is None:
+            tier = LARGE if prompt_tokens > self.large_prompt_tokens else FAST
+        preferred = self.lanes[tier]
+        other = self.lanes[LARGE if tier == FAST else FAST]
+        lanes = [preferred]
+        # The large model can always take over; the fast one only if the prompt fits untrimmed.
+        if other.tier == LARGE or prompt_tokens <= other.max_input_tokens:
+            lanes.append(other)
+        return lanes
+
+    def _pick_lane(self, lanes: List[ModelLane]) -> Tuple[ModelLane, bool]:
+        """First lane whose breaker lets the request through, and whether it is the probe."""
+        for i, lane in enumerate(lanes):
+            admitted = lane.breaker.allow()
+            if admitted:
+                if i:
+                    self._count("fallbacks")
+                    logger.info(f"AI request routed to fallback model {lane.model}.")
+                return lane, admitted == "probe"
+            lane._count("rejected_open")
+        raise GatewayError(503, "AI service temporarily unavailable, please retry later",
+                           retry_after=min(lane.breaker.retry_after() for lane in lanes))
+
+    def complete(self, system: str, prompt: str, max_tokens: int, tier: Optional[str] = None,
+                 temperature: float = 0.7, json_object: bool = False) -> Tuple[str, ModelLane]:
+        """Route, trim and send a single-turn chat completion. Returns (text, lane)."""
+        prompt_tokens = self.counter.count_messages([
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ])
+        lane, probe = self._pick_lane(self.route(prompt_tokens, tier))
+        if prompt_tokens > lane.max_input_tokens:
+            budget = lane.max_input_tokens - (prompt_tokens - self.counter.count(prompt))
+            prompt = self.counter.trim(prompt, budget)
+            self._count("trimmed_prompts")
+            logger.info(f"Trimmed AI prompt from {prompt_tokens} tokens to fit {lane.model}.")
+
+        extra = {"response_format": {"type": "json_object"}} if json_object else {}
+        response = lane.call(
+            lambda model: self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **extra,
+            ),
+            self.acquire_timeout,
+            probe,
+        )
+        return (response.choices[0].message.content or "").strip(), lane
+
+    # Tasks -------------------------------------------------------------------
+
+    def chat(self, prompt: str) -> dict:
+        reply, lane = self.complete(CHAT_SYSTEM_PROMPT, prompt, AI_CHAT_MAX_TOKENS)
+        return {"reply": reply, "model": lane.model}
+
+    def _plan_line(self, plan) -> str:
+        line = f"{plan.id}: {plan.title}"
+        if plan.due_date:
+            line += f" (due {plan.due_date:%Y-%m-%d})"
+        if plan.is_completed:
+            line += " [completed]"
+        if plan.description:
+            line += f" - {plan.description}"
+        return self.counter.trim(" ".join(line.split()), AI_SUMMARY_PLAN_TOKENS)
+
+    def pack_batches(self, lines: List[Tuple[int, str]], max_plans: int = AI_SUMMARY_BATCH_MAX_PLANS) -> List[List[Tuple[int, str]]]:
+        """Greedily pack plan lines into batches that fit the fast lane's input budget."""
+        budget = self.lanes[FAST].max_input_tokens - self.counter.count_messages(
+            [{"role": "system", "content": SUMMARY_SYSTEM_PROMPT}, {"role": "user", "content": ""}]
+        )
+        batches, batch, used = [], [], 0
+        for plan_id, line in lines:
+            cost = self.counter.count(line) + 1  # + newline
+            if batch and (used + cost > budget or len(batch) >= max_plans):
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append((plan_id, line))
+            used += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def summarize_plans(self, plans) -> dict:
+        """One-sentence summaries for many plans, several plans per upstream call."""
+        batches = self.pack_batches([(plan.id, self._plan_line(plan)) for plan in plans])
+        summaries, missing, models = [], [], []
+        for batch in batches:
+            ids = [plan_id for plan_id, _ in batch]
+            text, lane = self.complete(
+                SUMMARY_SYSTEM_PROMPT,
+                "\n".join(line for _, line in batch),
+                max_tokens=SUMMARY_TOKENS_PER_PLAN * len(batch) + 50,
+                tier=FAST,
+                temperature=0.2,
+                json_object=True,
+            )
+            if lane.model not in models:
+                models.append(lane.model)
+            self._count("summary_batches")
+            self._count("summary_plans", len(batch))
+            found = self._parse_summaries(text, set(ids))
+            summaries.extend({"plan_id": plan_id, "summary": found[plan_id]} for plan_id in ids if plan_id in found)
+            missing.extend(plan_id for plan_id in ids if plan_id not in found)
+        if missing:
+            logger.warning(f"AI summary response omitted {len(missing)} plans.")
+        return {"summaries": summaries, "missing": missing, "batches": len(batches), "models": models}
+
+    def _parse_summaries(self, text: str, ids: set) -> dict:
+        try:
+            items = json.loads(text)["summaries"]
+            return {
+                int(item["id"]): str(item["summary"]).strip()
+                for item in items
+                if int(item["id"]) in ids and item.get("summary")
+            }
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Invalid AI summary response: {e}")
+            return {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update({
+            "exact_token_counts": self.counter.exact,
+            "lanes": {tier: lane.stats() for tier, lane in self.lanes.items()},
+        })
+        return metrics
+
+
+ai_gateway = AIGateway(
+    fast=ModelLane(FAST, AI_FAST_MODEL, AI_FAST_MAX_INPUT_TOKENS, AI_FAST_CONCURRENCY),
+    large=ModelLane(LARGE, AI_LARGE_MODEL, AI_LARGE_MAX_INPUT_TOKENS, AI_LARGE_CONCURRENCY),
+)
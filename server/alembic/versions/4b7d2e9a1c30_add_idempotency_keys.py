@@ -0,0 +1,43 @@
+"""add_idempotency_keys
+
+Revision ID: 4b7d2e9a1c30
+Revises: e305963b5605
+Create Date: 2026-10-19 09:12:44.104512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7d2e9a1c30'
+down_revision: Union[str, None] = 'e305963b5605'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('scope', sa.String(), nullable=False),
+        sa.Column('request_hash', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('response_status', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key', 'scope', name='uq_idempotency_key_scope'),
+    )
+    op.create_index(op.f('ix_idempotency_keys_id'), 'idempotency_keys', ['id'], unique=False)
+    op.create_index(op.f('ix_idempotency_keys_expires_at'), 'idempotency_keys', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_idempotency_keys_expires_at'), table_name='idempotency_keys')
+    op.drop_index(op.f('ix_idempotency_keys_id'), table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
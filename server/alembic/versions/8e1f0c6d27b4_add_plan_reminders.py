@@ -0,0 +1,34 @@
+"""add_plan_reminders
+
+Revision ID: 8e1f0c6d27b4
+Revises: 4b7d2e9a1c30
+Create Date: 2026-10-19 11:03:27.519840
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e1f0c6d27b4'
+down_revision: Union[str, None] = '4b7d2e9a1c30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('plans', sa.Column('last_reminded_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'ix_plans_due_date_open',
+        'plans',
+        ['due_date'],
+        unique=False,
+        postgresql_where=sa.text('is_completed = false'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_plans_due_date_open', table_name='plans')
+    op.drop_column('plans', 'last_reminded_at')
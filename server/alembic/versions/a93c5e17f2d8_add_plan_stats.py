@@ -0,0 +1,54 @@
+"""add_plan_stats
+
+Revision ID: a93c5e17f2d8
+Revises: 8e1f0c6d27b4
+Create Date: 2026-10-19 13:41:05.228716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a93c5e17f2d8'
+down_revision: Union[str, None] = '8e1f0c6d27b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('plans', sa.Column('completed_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'ix_plans_user_due_date_open',
+        'plans',
+        ['user_id', 'due_date'],
+        unique=False,
+        postgresql_where=sa.text('is_completed = false'),
+    )
+    op.create_table(
+        'plan_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total_plans', sa.Integer(), nullable=False),
+        sa.Column('completed_plans', sa.Integer(), nullable=False),
+        sa.Column('current_streak', sa.Integer(), nullable=False),
+        sa.Column('longest_streak', sa.Integer(), nullable=False),
+        sa.Column('last_completion_date', sa.Date(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    # Populate counters for existing users; equivalent to `python plan_stats.py rebuild`
+    # except that streaks start empty because older plans have no completed_at.
+    op.execute(
+        "INSERT INTO plan_stats (user_id, total_plans, completed_plans, current_streak, longest_streak, updated_at) "
+        "SELECT users.id, COUNT(plans.id), COUNT(plans.id) FILTER (WHERE plans.is_completed), 0, 0, NOW() "
+        "FROM users LEFT JOIN plans ON plans.user_id = users.id GROUP BY users.id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('plan_stats')
+    op.drop_index('ix_plans_user_due_date_open', table_name='plans')
+    op.drop_column('plans', 'completed_at')
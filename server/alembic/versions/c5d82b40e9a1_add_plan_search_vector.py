@@ -0,0 +1,37 @@
+"""add_plan_search_vector
+
+Revision ID: c5d82b40e9a1
+Revises: a93c5e17f2d8
+Create Date: 2026-10-19 15:22:38.904113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d82b40e9a1'
+down_revision: Union[str, None] = 'a93c5e17f2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Stored generated column: Postgres keeps it current on every INSERT/UPDATE.
+    op.execute(
+        """
+        ALTER TABLE plans ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED
+        """
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_plans_search_vector ON plans USING GIN (search_vector)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_plans_search_vector")
+    op.execute("ALTER TABLE plans DROP COLUMN IF EXISTS search_vector")
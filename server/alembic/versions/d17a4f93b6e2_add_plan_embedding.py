@@ -0,0 +1,27 @@
+"""add_plan_embedding
+
+Revision ID: d17a4f93b6e2
+Revises: c5d82b40e9a1
+Create Date: 2026-10-19 17:08:51.663290
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd17a4f93b6e2'
+down_revision: Union[str, None] = 'c5d82b40e9a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Populate afterwards with `python plan_vectors.py backfill`.
+    op.add_column('plans', sa.Column('embedding', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('plans', 'embedding')
@@ -0,0 +1,26 @@
+"""add_plan_stats_version
+
+Revision ID: e6b3f8a05c19
+Revises: d17a4f93b6e2
+Create Date: 2026-10-19 19:26:12.381047
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b3f8a05c19'
+down_revision: Union[str, None] = 'd17a4f93b6e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('plan_stats', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('plan_stats', 'version')
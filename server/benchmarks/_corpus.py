@@ -0,0 +1,9 @@
+# server/benchmarks/_corpus.py
+# Task vocabulary shared by the benchmark scripts for synthetic plan text.
+
+WORDS = (
+    "buy groceries call mom finish report book flight gym workout read chapter plan trip "
+    "pay rent clean kitchen water plants prepare slides review budget write blog update resume "
+    "schedule dentist renew passport learn spanish practice guitar meditate walk dog fix bike "
+    "organize garage email team submit taxes cook dinner study exam backup laptop"
+).split()
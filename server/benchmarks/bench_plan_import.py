@@ -0,0 +1,134 @@
+# server/benchmarks/bench_plan_import.py
+# Measures bulk plan import throughput (rows/sec) and peak memory.
+#
+# Usage (from server/):
+#   python benchmarks/bench_plan_import.py --rows 1000000
+#   python benchmarks/bench_plan_import.py --format ics --rows 200000
+#   python benchmarks/bench_plan_import.py --database-url postgresql://.../bench_db --tracemalloc
+#
+# Point --database-url at a throwaway database: the script inserts rows.
+# Defaults to a temporary SQLite file, which exercises the executemany path;
+# Postgres exercises COPY. Peak RSS covers the whole process. --tracemalloc
+# also reports the Python heap peak during the import, but slows it down.
+
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from _corpus import WORDS
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def write_file(path: str, fmt: str, n_rows: int, error_rate: float, seed: int):
+    """Write the input file row by row so generation never holds it in memory."""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(["title", "description", "due_date", "is_completed"])
+        else:
+            f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//bench//EN\r\n")
+        for i in range(n_rows):
+            title = " ".join(rng.choices(WORDS, k=rng.randint(2, 5)))
+            description = " ".join(rng.choices(WORDS, k=rng.randint(0, 15)))
+            due = start + timedelta(minutes=rng.randrange(525_600))
+            completed = rng.random() < 0.3
+            bad = rng.random() < error_rate
+            if writer:
+                writer.writerow([
+                    "" if bad else title,
+                    description,
+                    due.isoformat() if rng.random() < 0.8 else "",
+                    "true" if completed else "false",
+                ])
+            else:
+                f.write("BEGIN:VTODO\r\n")
+                f.write(f"UID:bench-{i}\r\n")
+                f.write(f"SUMMARY:{title}\r\n")
+                if description:
+                    f.write(f"DESCRIPTION:{description}\r\n")
+                f.write(f"DUE:{'not-a-date' if bad else due.strftime('%Y%m%dT%H%M%SZ')}\r\n")
+                if completed:
+                    f.write("STATUS:COMPLETED\r\n")
+                f.write("END:VTODO\r\n")
+        if not writer:
+            f.write("END:VCALENDAR\r\n")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk plan import.")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--format", choices=["csv", "ics"], default="csv")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk", type=int, default=None, help="Defaults to PLAN_IMPORT_CHUNK_SIZE")
+    parser.add_argument("--error-rate", type=float, default=0.001, help="Fraction of rows made invalid")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the Python heap peak")
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        args.database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_import.db")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    import logging
+    logging.disable(logging.INFO)
+
+    from database import engine, SessionLocal
+    from models import User, init_db
+    from config import PLAN_IMPORT_CHUNK_SIZE
+    import plan_import
+
+    print(f"Database: {engine.dialect.name}")
+    init_db()
+
+    path = os.path.join(tempfile.mkdtemp(), f"plans.{args.format}")
+    started = time.perf_counter()
+    write_file(path, args.format, args.rows, args.error_rate, args.seed)
+    print(f"Generated {args.rows:,} rows ({os.path.getsize(path) / 1e6:.1f} MB) "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    db = SessionLocal()
+    try:
+        user = User(email=f"import-bench-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        db.commit()
+
+        rss_before = peak_rss_mb()
+        if args.tracemalloc:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with open(path, encoding="utf-8-sig", newline="") as stream:
+            result = plan_import.import_plans(db, user.id, stream, args.format,
+                                              chunk_size=args.chunk or PLAN_IMPORT_CHUNK_SIZE)
+        elapsed = time.perf_counter() - started
+
+        print(f"Imported {result.imported:,} rows ({result.failed:,} rejected) in {result.chunks} chunks")
+        print(f"Elapsed: {elapsed:.1f}s, {args.rows / elapsed:,.0f} rows/sec parsed, "
+              f"{result.imported / elapsed:,.0f} rows/sec inserted")
+        print(f"Peak RSS: {peak_rss_mb():.1f} MB (before import: {rss_before:.1f} MB)")
+        if args.tracemalloc:
+            _, heap_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Python heap peak during import: {heap_peak / 1e6:.1f} MB")
+    finally:
+        db.close()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# server/benchmarks/bench_plan_search.py
+# Measures /plans/search query latency against a large plans table.
+#
+# Usage (from server/):
+#   python benchmarks/bench_plan_search.py --plans 1000000 --users 1000
+#   python benchmarks/bench_plan_search.py --database-url postgresql://.../bench_db --compare-ilike
+#
+# Point --database-url at a throwaway database: the script inserts rows.
+# A Postgres database must be migrated first (`alembic upgrade head`), since
+# the search_vector column only comes from the migration.
+# Defaults to a temporary SQLite file, which exercises the FTS5 fallback.
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from _corpus import WORDS
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Common task words plus a long tail of synthetic terms, drawn with Zipf-like
+# weights so term frequencies resemble real text instead of every term
+# matching a large share of rows.
+VOCABULARY = WORDS + [f"term{i}" for i in range(50_000)]
+CUM_WEIGHTS = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+def random_text(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=n_words))
+
+
+def populate(engine, n_plans: int, n_users: int, chunk: int, seed: int):
+    from sqlalchemy import insert
+    from models import Plan, User
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"email": f"bench{u}@example.com", "hashed_password": "x", "is_active": True}
+            for u in range(n_users)
+        ])
+        first_user = conn.execute(User.__table__.select().order_by(User.id).limit(1)).first().id
+
+    started = time.perf_counter()
+    for start in range(0, n_plans, chunk):
+        rows = [
+            {
+                "user_id": first_user + rng.randrange(n_users),
+                "title": random_text(rng, rng.randint(2, 5)),
+                "description": random_text(rng, rng.randint(0, 20)) or None,
+                "created_at": now,
+                "is_completed": rng.random() < 0.3,
+            }
+            for _ in range(min(chunk, n_plans - start))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(Plan.__table__), rows)
+        print(f"\rInserted {start + len(rows):,}/{n_plans:,} plans", end="", flush=True)
+    print(f"\nPopulated in {time.perf_counter() - started:.1f}s")
+    return first_user
+
+
+def time_queries(fn, queries):
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        fn(q)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "p99": timings[int(len(timings) * 0.99) - 1],
+        "max": timings[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark plan full-text search.")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--plans", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chunk", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--compare-ilike", action="store_true", help="Also time an ILIKE '%%q%%' scan")
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        args.database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    import logging
+    logging.disable(logging.INFO)
+
+    from sqlalchemy import inspect, or_
+    from database import engine, SessionLocal
+    from models import Plan, init_db
+    import plan_search
+
+    print(f"Database: {engine.dialect.name}")
+    init_db()
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            if "search_vector" not in [c["name"] for c in inspect(conn).get_columns("plans")]:
+                raise SystemExit("plans.search_vector is missing; run `alembic upgrade head` on this database first.")
+    first_user = populate(engine, args.plans, args.users, args.chunk, args.seed)
+
+    rng = random.Random(args.seed + 1)
+    queries = [(first_user + rng.randrange(args.users), random_text(rng, rng.randint(1, 2)))
+               for _ in range(args.queries)]
+
+    db = SessionLocal()
+    try:
+        fts = time_queries(lambda uq: plan_search.search_plans(db, uq[0], uq[1], 21, 0), queries)
+        print("Full-text search (ms): " + ", ".join(f"{k}={v:.2f}" for k, v in fts.items()))
+
+        if args.compare_ilike:
+            def ilike(uq):
+                pattern = f"%{uq[1]}%"
+                (db.query(Plan)
+                   .filter(Plan.user_id == uq[0], or_(Plan.title.ilike(pattern), Plan.description.ilike(pattern)))
+                   .limit(21).all())
+            scan = time_queries(ilike, queries)
+            print("ILIKE scan (ms):       " + ", ".join(f"{k}={v:.2f}" for k, v in scan.items()))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
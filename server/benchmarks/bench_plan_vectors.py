@@ -0,0 +1,85 @@
+# server/benchmarks/bench_plan_vectors.py
+# Measures the memory footprint and query latency of per-user plan vector indexes.
+#
+# Usage (from server/):
+#   python benchmarks/bench_plan_vectors.py --users 1000 --plans-per-user 500
+#
+# Indexes are built in memory from synthetic plan text; no database rows are written.
+
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+from _corpus import WORDS
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark plan vector index memory and latency.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--plans-per-user", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=None, help="Defaults to PLAN_EMBEDDING_DIM")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    from config import PLAN_EMBEDDING_DIM
+    from plan_vectors import HashingEmbedder, UserVectorIndex, plan_text
+
+    dim = args.dim or PLAN_EMBEDDING_DIM
+    embedder = HashingEmbedder(dim)
+    rng = random.Random(args.seed)
+
+    def random_plan():
+        return plan_text(" ".join(rng.choices(WORDS, k=rng.randint(2, 5))),
+                         " ".join(rng.choices(WORDS, k=rng.randint(0, 15))))
+
+    started = time.perf_counter()
+    sample = [embedder.embed(random_plan()) for _ in range(2000)]
+    embed_ms = (time.perf_counter() - started) * 1000 / len(sample)
+    print(f"Embedding: {embed_ms:.3f} ms/plan (dim={dim}, {dim * 4} bytes stored per plan)")
+
+    tracemalloc.start()
+    indexes = []
+    plan_id = 0
+    for _ in range(args.users):
+        index = UserVectorIndex(dim)
+        for _ in range(args.plans_per_user):
+            plan_id += 1
+            index.upsert(plan_id, sample[plan_id % len(sample)])
+        indexes.append(index)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_plans = args.users * args.plans_per_user
+    index_bytes = sum(index.nbytes for index in indexes)
+    print(f"Indexes: {args.users:,} users x {args.plans_per_user:,} plans = {total_plans:,} vectors")
+    print(f"  array bytes:     {index_bytes / 2**20:,.1f} MiB ({index_bytes / total_plans:,.0f} B/plan incl. growth slack)")
+    print(f"  traced current:  {current / 2**20:,.1f} MiB (arrays + id->position dicts)")
+    print(f"  traced peak:     {peak / 2**20:,.1f} MiB")
+    print(f"  process max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.1f} MiB")
+
+    timings = []
+    for _ in range(args.queries):
+        index = rng.choice(indexes)
+        query = sample[rng.randrange(len(sample))]
+        t0 = time.perf_counter()
+        index.query(query, 3, 0.8)
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    print(f"Duplicate query (ms): p50={statistics.median(timings):.3f}, "
+          f"p95={timings[int(len(timings) * 0.95) - 1]:.3f}, max={timings[-1]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
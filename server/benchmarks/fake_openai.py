@@ -0,0 +1,144 @@
+# server/benchmarks/fake_openai.py
+# Local stand-in for the OpenAI chat completions API, for exercising ai_gateway.py.
+#
+# Usage (from server/):
+#   python benchmarks/fake_openai.py --port 8089 --latency 0.2 --fail-rate 0.1
+#   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=test uvicorn main:app
+#
+# Replies echo the model and prompt size. JSON-mode requests get a summary for
+# every "<id>: <plan>" line, the format ai_gateway uses for plan batches.
+# --latency/--jitter slow responses down; --fail-rate returns 500s, and
+# --hang-rate never answers in time, so timeouts and circuit breakers can be
+# observed. GET /stats reports what the fake has received.
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PLAN_LINE = re.compile(r"^(\d+): (.*)$", re.MULTILINE)
+
+
+class FakeOpenAIState:
+    def __init__(self, latency: float, jitter: float, fail_rate: float, hang_rate: float, hang_seconds: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "failures": 0, "hangs": 0, "max_in_flight": 0, "by_model": {}}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+
+def completion(body: dict) -> dict:
+    messages = body.get("messages", [])
+    prompt = messages[-1]["content"] if messages else ""
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps({"summaries": [
+            {"id": int(plan_id), "summary": f"Summary of {text[:60].strip()}"}
+            for plan_id, text in PLAN_LINE.findall(prompt)
+        ]})
+    else:
+        content = f"[{body.get('model')}] Reply to a {len(prompt)}-character prompt."
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-fake-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def make_handler(state: FakeOpenAIState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send(200, state.snapshot())
+            else:
+                self._send(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "Not found"}})
+                return
+            model = body.get("model", "unknown")
+            with state.lock:
+                state.in_flight += 1
+                state.stats["requests"] += 1
+                state.stats["by_model"][model] = state.stats["by_model"].get(model, 0) + 1
+                state.stats["max_in_flight"] = max(state.stats["max_in_flight"], state.in_flight)
+            try:
+                roll = random.random()
+                if roll < state.hang_rate:
+                    with state.lock:
+                        state.stats["hangs"] += 1
+                    time.sleep(state.hang_seconds)
+                else:
+                    time.sleep(max(0.0, state.latency + random.uniform(-state.jitter, state.jitter)))
+                if roll < state.hang_rate + state.fail_rate:
+                    with state.lock:
+                        state.stats["failures"] += 1
+                    self._send(500, {"error": {"message": "Fake upstream failure", "type": "server_error"}})
+                    return
+                self._send(200, completion(body))
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that stall")
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    args = parser.parse_args()
+
+    state = FakeOpenAIState(args.latency, args.jitter, args.fail_rate, args.hang_rate, args.hang_seconds)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# server/idempotency.py
+# Idempotency-Key support for retried POST requests.
+#
+# Completed responses are stored in the idempotency_keys table (with a TTL) and
+# mirrored in a small per-worker LRU so that replays are answered without
+# touching the database or re-running the handler, auth lookup included.
+# Concurrent duplicates in one worker wait on a per-key event; across workers
+# they are serialized by the unique (key, scope) constraint on the claim row.
+# No lock shared between keys is held while polling or running the handler.
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import logging
+
+from models import IdempotencyKey
+from config import (
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_LOCK_TIMEOUT_SECONDS,
+    IDEMPOTENCY_ABANDON_SECONDS,
+    IDEMPOTENCY_CACHE_SIZE,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL_SECONDS = 300
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class _CachedResponse:
+    __slots__ = ("request_hash", "status_code", "body", "expires_at")
+
+    def __init__(self, request_hash: str, status_code: int, body: bytes, expires_at: float):
+        self.request_hash = request_hash
+        self.status_code = status_code
+        self.body = body
+        self.expires_at = expires_at
+
+
+class IdempotencyGuard:
+    """Handle returned by IdempotencyStore.guard() for a single request."""
+
+    def __init__(self, store: "IdempotencyStore", db: Session, key: Optional[str], scope: str, request_hash: str):
+        self.store = store
+        self.db = db
+        self.key = key
+        self.scope = scope
+        self.request_hash = request_hash
+        self.replay: Optional[Response] = None
+        self._claim: Optional[IdempotencyKey] = None
+        self._body: Optional[bytes] = None
+        self._status_code: Optional[int] = None
+
+    @property
+    def active(self) -> bool:
+        return self.key is not None and self.replay is None
+
+    def record(self, response_obj, status_code: int = 200):
+        """Attach the response to the claim row.
+
+        Call this after db.flush() and before db.commit() so the stored
+        response commits in the same transaction as the handler's writes.
+        """
+        if not self.active or self._claim is None:
+            return
+        body = json.dumps(jsonable_encoder(response_obj), separators=(",", ":")).encode("utf-8")
+        self._claim.status = "completed"
+        self._claim.response_status = status_code
+        self._claim.response_body = body.decode("utf-8")
+        self._body = body
+        self._status_code = status_code
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: int, lock_timeout_seconds: int, cache_size: int,
+                 abandon_seconds: int = IDEMPOTENCY_ABANDON_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lock_timeout_seconds = lock_timeout_seconds
+        # Must exceed the slowest healthy handler, or a live request runs twice.
+        self.abandon_seconds = max(abandon_seconds, lock_timeout_seconds)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, _CachedResponse]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._inflight: Dict[tuple, threading.Event] = {}
+        self._inflight_lock = threading.Lock()
+        self._last_purge = 0.0
+
+    # Front cache -----------------------------------------------------------
+
+    def _cache_get(self, cache_key: tuple) -> Optional[_CachedResponse]:
+        with self._cache_lock:
+            entry = self._cache.get(cache_key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                del self._cache[cache_key]
+                return None
+            self._cache.move_to_end(cache_key)
+            return entry
+
+    def _cache_put(self, cache_key: tuple, entry: _CachedResponse):
+        with self._cache_lock:
+            self._cache[cache_key] = entry
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    # Helpers ---------------------------------------------------------------
+
+    @staticmethod
+    def make_scope(method: str, path: str, token: Optional[str]) -> str:
+        # The raw token is never stored; its digest keeps keys private per caller
+        # without a user lookup on the replay path.
+        token_digest = hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:32]
+        return f"{method.upper()} {path}:{token_digest}"
+
+    @staticmethod
+    def hash_payload(payload) -> str:
+        encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _replay_response(self, entry: _CachedResponse, request_hash: str) -> Response:
+        if entry.request_hash != request_hash:
+            logger.warning("Idempotency-Key reused with a different request payload.")
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        return Response(
+            content=entry.body,
+            status_code=entry.status_code,
+            media_type="application/json",
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    def _entry_from_row(self, row: IdempotencyKey) -> _CachedResponse:
+        expires_at = time.time() + max((row.expires_at - datetime.utcnow()).total_seconds(), 0)
+        return _CachedResponse(row.request_hash, row.response_status, row.response_body.encode("utf-8"), expires_at)
+
+    def _maybe_purge(self, db: Session):
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        self.purge_expired(db)
+
+    def purge_expired(self, db: Session) -> int:
+        """Delete expired idempotency rows. Returns the number of rows removed."""
+        try:
+            deleted = (
+                db.query(IdempotencyKey)
+                .filter(IdempotencyKey.expires_at < datetime.utcnow())
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+            if deleted:
+                logger.info(f"Purged {deleted} expired idempotency keys.")
+            return deleted
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error purging idempotency keys: {e}")
+            return 0
+
+    # Local in-flight tracking ----------------------------------------------
+
+    def _enter_local(self, cache_key: tuple) -> Optional[threading.Event]:
+        """Become this worker's owner of cache_key, or get the current owner's event."""
+        with self._inflight_lock:
+            event = self._inflight.get(cache_key)
+            if event is None:
+                self._inflight[cache_key] = threading.Event()
+            return event
+
+    def _exit_local(self, cache_key: tuple):
+        with self._inflight_lock:
+            event = self._inflight.pop(cache_key, None)
+        if event is not None:
+            event.set()
+
+    # Claiming --------------------------------------------------------------
+
+    def _claim(self, db: Session, key: str, scope: str, request_hash: str):
+        """Return (claim_row, None) if this request should run, or (None, entry) to replay."""
+        deadline = time.time() + self.lock_timeout_seconds
+        while True:
+            row = (
+                db.query(IdempotencyKey)
+                .filter(IdempotencyKey.key == key, IdempotencyKey.scope == scope)
+                .first()
+            )
+            now = datetime.utcnow()
+            if row is not None and row.expires_at < now:
+                db.query(IdempotencyKey).filter(
+                    IdempotencyKey.id == row.id, IdempotencyKey.expires_at < now
+                ).delete(synchronize_session=False)
+                db.commit()
+                continue
+
+            if row is None:
+                claim = IdempotencyKey(
+                    key=key,
+                    scope=scope,
+                    request_hash=request_hash,
+                    status="in_progress",
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                )
+                db.add(claim)
+                try:
+                    db.commit()
+                    return claim, None
+                except IntegrityError:
+                    # Another worker claimed the key first; re-read it.
+                    db.rollback()
+                    continue
+
+            if row.status == "completed":
+                return None, self._entry_from_row(row)
+
+            if row.request_hash != request_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+            # In progress elsewhere. Take over abandoned claims, otherwise wait.
+            if (now - row.created_at).total_seconds() > self.abandon_seconds:
+                # Compare-and-set on created_at so only one waiter wins the takeover.
+                taken = db.query(IdempotencyKey).filter(
+                    IdempotencyKey.id == row.id,
+                    IdempotencyKey.status == "in_progress",
+                    IdempotencyKey.created_at == row.created_at,
+                ).update({"created_at": now}, synchronize_session=False)
+                db.commit()
+                if taken == 1:
+                    logger.warning(f"Took over abandoned idempotency claim {row.id}.")
+                    db.refresh(row)
+                    return row, None
+                db.expire_all()
+                continue
+            if time.time() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            db.expire_all()
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+    def _release(self, db: Session, claim: IdempotencyKey):
+        try:
+            db.rollback()
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == claim.id, IdempotencyKey.status == "in_progress"
+            ).delete(synchronize_session=False)
+            db.commit()
+            if claim in db:
+                db.expunge(claim)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error releasing idempotency claim: {e}")
+
+    @contextmanager
+    def guard(self, db: Session, key: Optional[str], scope: str, payload):
+        """Serialize and replay requests carrying the same Idempotency-Key.
+
+        Usage:
+            with store.guard(db, key, scope, payload) as guard:
+                if guard.replay is not None:
+                    return guard.replay
+                ...
+                db.flush()
+                guard.record(response_obj)
+                db.commit()
+
+        Requests without a key pass straight through.
+        """
+        if not key:
+            yield IdempotencyGuard(self, db, None, scope, "")
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+        request_hash = self.hash_payload(payload)
+        guard = IdempotencyGuard(self, db, key, scope, request_hash)
+        cache_key = (key, scope)
+
+        entry = self._cache_get(cache_key)
+        if entry is not None:
+            logger.debug(f"Idempotency-Key replay from front cache: {scope}")
+            guard.replay = self._replay_response(entry, request_hash)
+            yield guard
+            return
+
+        # A duplicate already running in this worker: wait for it, then replay
+        # from the front cache. Only this key's own event is waited on.
+        deadline = time.time() + self.lock_timeout_seconds
+        while True:
+            running = self._enter_local(cache_key)
+            if running is None:
+                break
+            if not running.wait(max(deadline - time.time(), 0)):
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            entry = self._cache_get(cache_key)
+            if entry is not None:
+                logger.debug(f"Idempotency-Key replay after local duplicate: {scope}")
+                guard.replay = self._replay_response(entry, request_hash)
+                yield guard
+                return
+            # The other request failed without a response; try to claim the key.
+
+        try:
+            self._maybe_purge(db)
+            claim, entry = self._claim(db, key, scope, request_hash)
+            if entry is not None:
+                self._cache_put(cache_key, entry)
+                logger.debug(f"Idempotency-Key replay from store: {scope}")
+                guard.replay = self._replay_response(entry, request_hash)
+                yield guard
+                return
+
+            guard._claim = claim
+            try:
+                yield guard
+            except BaseException:
+                self._release(db, claim)
+                raise
+            if guard._body is None:
+                # Handler returned without recording a response; free the key.
+                self._release(db, claim)
+                return
+            self._cache_put(
+                cache_key,
+                _CachedResponse(request_hash, guard._status_code, guard._body, time.time() + self.ttl_seconds),
+            )
+        finally:
+            self._exit_local(cache_key)
+
+
+idempotency_store = IdempotencyStore(
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+    lock_timeout_seconds=IDEMPOTENCY_LOCK_TIMEOUT_SECONDS,
+    cache_size=IDEMPOTENCY_CACHE_SIZE,
+    abandon_seconds=IDEMPOTENCY_ABANDON_SECONDS,
+)
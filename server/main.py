@@ -1,8 +1,13 @@
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, plans, ai, onboarding
+from routers import auth, plans, ai, onboarding, admin
 from models import init_db
+from database import engine, SessionLocal
+from config import REMINDERS_ENABLED
+from reminders import ReminderService, build_sinks, build_leader_lock
+from plan_cache import plan_cache
+from profiling import ProfilingMiddleware, install_sql_hooks
 import logging
 import openai
 
@@ -38,6 +43,10 @@ app.add_middleware(
 )
 logger.info("CORS middleware added.")
 
+# Admin-triggered/sampled request profiling and slow-query capture
+install_sql_hooks(engine)
+app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 logger.debug("Including auth router.")
 app.include_router(auth.router)
@@ -54,6 +63,38 @@ logger.debug("AI router included.")
 logger.debug("Including onboarding router.")
 app.include_router(onboarding.router)
 
+logger.debug("Including admin router.")
+app.include_router(admin.router)
+
+# Due-date reminders (one leader across workers)
+reminder_service = None
+
+@app.on_event("startup")
+def start_reminders():
+    global reminder_service
+    if not REMINDERS_ENABLED:
+        logger.debug("Reminder scheduler disabled.")
+        return
+    try:
+        reminder_service = ReminderService(SessionLocal, build_sinks(), build_leader_lock(engine))
+        reminder_service.start()
+    except Exception as e:
+        logger.error(f"Error starting reminder scheduler: {e}")
+
+@app.on_event("shutdown")
+def stop_reminders():
+    if reminder_service is not None:
+        reminder_service.stop()
+
+# Cross-worker plan cache invalidation (no-op without a shared tier)
+@app.on_event("startup")
+def start_plan_cache():
+    plan_cache.start()
+
+@app.on_event("shutdown")
+def stop_plan_cache():
+    plan_cache.stop()
+
 if __name__ == "__main__":
     logger.info("Starting FastAPI server.")
     try:
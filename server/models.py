@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, LargeBinary, UniqueConstraint, Index
+from sqlalchemy.orm import declarative_base, deferred, relationship
 from database import engine
 import logging
 from datetime import datetime
@@ -41,10 +41,56 @@ class Plan(Base):
     created_at = Column(DateTime, nullable=False)
     due_date = Column(DateTime)
     is_completed = Column(Boolean, default=False)  # Add this line
+    completed_at = Column(DateTime)  # Set when is_completed flips to True
+    last_reminded_at = Column(DateTime)  # Set by the reminder scheduler
+    # float32 vector, see plan_vectors.py; deferred so plan queries skip the ~1 KB blob
+    embedding = deferred(Column(LargeBinary))
 
     owner = relationship("User", back_populates="plans")
 
+# Partial index so the reminder scanner only walks open plans by due date.
+Index(
+    "ix_plans_due_date_open",
+    Plan.due_date,
+    postgresql_where=(Plan.is_completed == False),  # noqa: E712
+    sqlite_where=(Plan.is_completed == False),  # noqa: E712
+)
 
+# Per-user open plans by due date, for overdue counts in /plans/stats.
+Index(
+    "ix_plans_user_due_date_open",
+    Plan.user_id,
+    Plan.due_date,
+    postgresql_where=(Plan.is_completed == False),  # noqa: E712
+    sqlite_where=(Plan.is_completed == False),  # noqa: E712
+)
+
+class PlanStats(Base):
+    """Per-user plan counters, maintained in the same transaction as plan writes."""
+    __tablename__ = "plan_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_plans = Column(Integer, nullable=False, default=0)
+    completed_plans = Column(Integer, nullable=False, default=0)
+    current_streak = Column(Integer, nullable=False, default=0)  # Consecutive days with a completion
+    longest_streak = Column(Integer, nullable=False, default=0)
+    last_completion_date = Column(Date)
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every plan write; see plan_cache.py
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("key", "scope", name="uq_idempotency_key_scope"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, nullable=False)
+    scope = Column(String, nullable=False)  # "METHOD path:token-digest"
+    request_hash = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="in_progress")  # in_progress | completed
+    response_status = Column(Integer)
+    response_body = Column(String)  # Pre-encoded JSON body
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 def init_db():
@@ -52,5 +98,7 @@ def init_db():
     try:
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully.")
+        from plan_search import ensure_search_index
+        ensure_search_index(engine)
     except Exception as e:
         logger.error(f"Error creating database tables: {e}")
\ No newline at end of file
@@ -0,0 +1,292 @@
+# server/plan_cache.py
+# Cache of pre-encoded GET /plans/ responses.
+#
+# Tier 1 is a per-worker LRU bounded by entry count and total bytes. Tier 2 is
+# an optional shared store reached through a small Redis-compatible interface
+# (get/set/publish/subscribe). Entries are stamped with plan_stats.version,
+# which is bumped in the same transaction as every plan write, so a cached list
+# is only served for the version it was built from. Creates patch the cached
+# bytes in place; updates and deletes invalidate. Writers broadcast the new
+# version so other workers evict their stale copies eagerly.
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi.encoders import jsonable_encoder
+import logging
+
+from config import (
+    PLAN_CACHE_ENABLED,
+    PLAN_CACHE_MAX_ENTRIES,
+    PLAN_CACHE_MAX_BYTES,
+    PLAN_CACHE_MAX_ENTRY_BYTES,
+    PLAN_CACHE_REDIS_URL,
+    PLAN_CACHE_SHARED_TTL_SECONDS,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "plans:invalidate"
+
+
+def encode_json(content) -> bytes:
+    # Same settings as Starlette's JSONResponse so cached bytes match a fresh response.
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class CachedPlans:
+    __slots__ = ("version", "body", "built_at", "tier", "last_id")
+
+    def __init__(self, version: int, body: bytes, built_at: float, tier: str, last_id: Optional[int] = None):
+        self.version = version
+        self.body = body
+        self.built_at = built_at
+        self.tier = tier
+        self.last_id = last_id  # Highest plan id in body; None if unknown (loaded from the shared tier)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+
+class RedisSharedTier:
+    """Shared tier and invalidation bus over any Redis-protocol server."""
+
+    def __init__(self, url: str):
+        import redis  # Optional dependency, only needed when PLAN_CACHE_REDIS_URL is set
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: int):
+        self.client.set(key, value, ex=ttl_seconds)
+
+    def publish(self, channel: str, message: str):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channel: str, handler):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: lambda m: handler(m["data"].decode("utf-8"))})
+        return pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+
+class PlanListCache:
+    def __init__(self, max_entries: int, max_bytes: int, max_entry_bytes: int, shared=None,
+                 shared_ttl_seconds: int = PLAN_CACHE_SHARED_TTL_SECONDS, enabled: bool = True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.shared = shared
+        self.shared_ttl_seconds = shared_ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[int, CachedPlans]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._subscription = None
+        self._metrics = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "stale_evictions": 0,
+            "patches": 0,
+            "invalidations": 0,
+            "broadcasts_sent": 0,
+            "broadcasts_received": 0,
+            "capacity_evictions": 0,
+            "errors": 0,
+        }
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+        self._broadcast_lag_max = 0.0
+
+    # Local tier --------------------------------------------------------------
+
+    def _shared_key(self, user_id: int, version: int) -> str:
+        return f"plans:{user_id}:{version}"
+
+    def _store_local(self, user_id: int, entry: CachedPlans):
+        if len(entry.body) > self.max_entry_bytes:
+            self._drop_local(user_id)
+            return
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[user_id] = entry
+            self._bytes += len(entry.body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self._metrics["capacity_evictions"] += 1
+
+    def _drop_local(self, user_id: int, older_than: Optional[int] = None) -> bool:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or (older_than is not None and entry.version >= older_than):
+                return False
+            del self._entries[user_id]
+            self._bytes -= len(entry.body)
+            return True
+
+    def _record_hit(self, entry: CachedPlans, metric: str):
+        with self._lock:
+            self._metrics[metric] += 1
+            age = entry.age
+            self._served_age_total += age
+            self._served_age_max = max(self._served_age_max, age)
+
+    def _shared_call(self, method: str, *args):
+        if self.shared is None:
+            return None
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception as e:
+            self._metrics["errors"] += 1
+            logger.error(f"Plan cache shared tier {method} failed: {e}")
+            return None
+
+    # Reads -------------------------------------------------------------------
+
+    def get(self, user_id: int, version: int) -> Optional[CachedPlans]:
+        """Return the cached list for this exact version, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(user_id)
+            elif entry is not None:
+                self._metrics["stale_evictions"] += 1
+                del self._entries[user_id]
+                self._bytes -= len(entry.body)
+                entry = None
+        if entry is not None:
+            self._record_hit(entry, "l1_hits")
+            return entry
+
+        body = self._shared_call("get", self._shared_key(user_id, version))
+        if body is not None:
+            entry = CachedPlans(version, body, time.time(), "L2")
+            self._store_local(user_id, CachedPlans(version, body, entry.built_at, "L1"))
+            self._record_hit(entry, "l2_hits")
+            return entry
+
+        with self._lock:
+            self._metrics["misses"] += 1
+        return None
+
+    def put(self, user_id: int, version: int, body: bytes, last_id: Optional[int] = None):
+        if not self.enabled:
+            return
+        self._store_local(user_id, CachedPlans(version, body, time.time(), "L1", last_id))
+        if len(body) <= self.max_entry_bytes:
+            self._shared_call("set", self._shared_key(user_id, version), body, self.shared_ttl_seconds)
+
+    # Writes ------------------------------------------------------------------
+
+    def on_create(self, user_id: int, version: int, plan_out):
+        """Append a newly committed plan to the cached list for version - 1.
+
+        Lists are ordered by id, so the patch only applies when the new plan
+        sorts last; anything else falls back to invalidation.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if (entry is not None and entry.version == version - 1
+                and entry.last_id is not None and plan_out.id > entry.last_id):
+            item = encode_json(plan_out)
+            body = b"[" + item + b"]" if entry.body == b"[]" else entry.body[:-1] + b"," + item + b"]"
+            self.put(user_id, version, body, last_id=plan_out.id)
+            with self._lock:
+                self._metrics["patches"] += 1
+        else:
+            self._drop_local(user_id)
+        self._broadcast(user_id, version)
+
+    def on_change(self, user_id: int, version: int):
+        """Invalidate after a committed update or delete."""
+        if not self.enabled:
+            return
+        if self._drop_local(user_id, older_than=version):
+            with self._lock:
+                self._metrics["invalidations"] += 1
+        self._broadcast(user_id, version)
+
+    # Cross-worker invalidation -----------------------------------------------
+
+    def _broadcast(self, user_id: int, version: int):
+        if self.shared is None:
+            return
+        message = json.dumps({"user_id": user_id, "version": version, "sent_at": time.time()})
+        self._shared_call("publish", INVALIDATION_CHANNEL, message)
+        with self._lock:
+            self._metrics["broadcasts_sent"] += 1
+
+    def _on_broadcast(self, message: str):
+        try:
+            data = json.loads(message)
+            dropped = self._drop_local(int(data["user_id"]), older_than=int(data["version"]))
+            with self._lock:
+                self._metrics["broadcasts_received"] += 1
+                if dropped:
+                    self._metrics["invalidations"] += 1
+                self._broadcast_lag_max = max(self._broadcast_lag_max, time.time() - float(data["sent_at"]))
+        except Exception as e:
+            logger.error(f"Invalid plan cache broadcast {message!r}: {e}")
+
+    def start(self):
+        if self.shared is not None and self._subscription is None:
+            self._subscription = self._shared_call("subscribe", INVALIDATION_CHANNEL, self._on_broadcast)
+            logger.info("Subscribed to plan cache invalidations.")
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.stop()
+            self._subscription = None
+
+    # Observability -----------------------------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            hits = metrics["l1_hits"] + metrics["l2_hits"]
+            lookups = hits + metrics["misses"]
+            metrics.update({
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "served_age_avg_seconds": round(self._served_age_total / hits, 3) if hits else 0.0,
+                "served_age_max_seconds": round(self._served_age_max, 3),
+                "broadcast_lag_max_seconds": round(self._broadcast_lag_max, 3),
+                "shared_tier": self.shared is not None,
+            })
+            return metrics
+
+
+def _build_shared_tier():
+    if not PLAN_CACHE_REDIS_URL:
+        return None
+    try:
+        return RedisSharedTier(PLAN_CACHE_REDIS_URL)
+    except Exception as e:
+        logger.warning(f"Plan cache shared tier disabled: {e}")
+        return None
+
+
+plan_cache = PlanListCache(
+    max_entries=PLAN_CACHE_MAX_ENTRIES,
+    max_bytes=PLAN_CACHE_MAX_BYTES,
+    max_entry_bytes=PLAN_CACHE_MAX_ENTRY_BYTES,
+    shared=_build_shared_tier(),
+    enabled=PLAN_CACHE_ENABLED,
+)
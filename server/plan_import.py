@@ -0,0 +1,288 @@
+# server/plan_import.py
+# Bulk import of plans from CSV or iCalendar files.
+#
+# Files are parsed as a stream, one line at a time. Each row is validated
+# against PlanCreate, and valid rows are written in chunks with one
+# transaction per chunk. Postgres chunks go through COPY; other databases
+# use executemany. Per-user side tables (plan_stats counters, cache version,
+# vector index) are updated once per chunk rather than once per row.
+# Each row's embedding is computed during validation and stored with it, so
+# the similarity index reloads imported plans without re-embedding them.
+
+import csv
+import io
+import re
+from datetime import datetime, timezone
+from typing import IO, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import logging
+
+from models import Plan
+from config import PLAN_IMPORT_CHUNK_SIZE, PLAN_IMPORT_MAX_ERRORS
+from schemas import PlanCreate
+import plan_stats
+from plan_cache import plan_cache
+from plan_vectors import vector_store, encode as encode_embedding
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CSV_FORMAT = "csv"
+ICS_FORMAT = "ics"
+TRUE_VALUES = {"1", "true", "yes", "y", "done", "completed", "x"}
+COPY_COLUMNS = ("user_id", "title", "description", "created_at", "due_date", "is_completed", "embedding")
+
+
+class ImportFormatError(ValueError):
+    """The file as a whole cannot be imported (unknown format, missing columns)."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.chunks = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < PLAN_IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> dict:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str], requested: Optional[str] = None) -> str:
+    if requested:
+        if requested.lower() not in (CSV_FORMAT, ICS_FORMAT):
+            raise ImportFormatError("format must be 'csv' or 'ics'")
+        return requested.lower()
+    name = (filename or "").lower()
+    if name.endswith(".ics") or content_type == "text/calendar":
+        return ICS_FORMAT
+    if name.endswith(".csv") or content_type in ("text/csv", "application/vnd.ms-excel"):
+        return CSV_FORMAT
+    raise ImportFormatError("Unsupported file type; upload a .csv or .ics file")
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+# CSV -------------------------------------------------------------------------
+
+def iter_csv_rows(stream: IO[str]) -> Iterator[Tuple[int, dict]]:
+    """Yield (start line, raw fields) for each CSV record after the header."""
+    reader = csv.reader(stream)
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
+    columns = [h.strip().lower() for h in header]
+    if "title" not in columns:
+        raise ImportFormatError("CSV header must include a 'title' column")
+    start_line = reader.line_num + 1
+    for fields in reader:
+        # line_num is where the record ended; quoted fields may span lines.
+        line, start_line = start_line, reader.line_num + 1
+        if not any(f.strip() for f in fields):
+            continue
+        yield line, dict(zip(columns, fields))
+
+
+# iCalendar -------------------------------------------------------------------
+
+def _unfold(stream: IO[str]) -> Iterator[Tuple[int, str]]:
+    # RFC 5545 long lines continue on the next line after a single space or tab.
+    pending, pending_line = None, 0
+    for line_num, raw in enumerate(stream, start=1):
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending += line[1:]
+            continue
+        if pending is not None:
+            yield pending_line, pending
+        pending, pending_line = line, line_num
+    if pending is not None:
+        yield pending_line, pending
+
+
+def _ics_unescape(value: str) -> str:
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def _ics_datetime(value: str) -> Optional[str]:
+    value = value.strip()
+    for fmt in ("%Y%m%dT%H%M%SZ", "%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if value.endswith("Z"):
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.isoformat()
+    return value  # Let PlanCreate report the bad value
+
+
+def iter_ics_rows(stream: IO[str]) -> Iterator[Tuple[int, dict]]:
+    """Yield (line number, fields) for each VTODO/VEVENT component.
+
+    VTODO uses DUE and VEVENT uses DTSTART as the due date; STATUS:COMPLETED
+    or a COMPLETED property marks the plan completed. TZID parameters are
+    ignored, so local times are imported as written.
+    """
+    component, fields, start_line, depth = None, {}, 0, 0
+    for line_num, line in _unfold(stream):
+        name, _, value = line.partition(":")
+        name = name.split(";", 1)[0].upper()
+        if name == "BEGIN":
+            kind = value.strip().upper()
+            if component is None and kind in ("VTODO", "VEVENT"):
+                component, fields, start_line, depth = kind, {}, line_num, 0
+            elif component is not None:
+                depth += 1  # Nested VALARM etc.
+            continue
+        if name == "END" and component is not None:
+            if depth:
+                depth -= 1
+                continue
+            yield start_line, fields
+            component = None
+            continue
+        if component is None or depth:
+            continue
+        if name == "SUMMARY":
+            fields["title"] = _ics_unescape(value)
+        elif name == "DESCRIPTION":
+            fields["description"] = _ics_unescape(value)
+        elif (name == "DUE" and component == "VTODO") or (name == "DTSTART" and component == "VEVENT"):
+            fields["due_date"] = _ics_datetime(value)
+        elif name == "STATUS" and value.strip().upper() == "COMPLETED":
+            fields["is_completed"] = "true"
+        elif name == "COMPLETED":
+            fields["is_completed"] = "true"
+
+
+# Validation and ingestion ----------------------------------------------------
+
+def _to_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def validate_row(user_id: int, fields: dict, created_at: datetime) -> dict:
+    """Return the plans row for fields, or raise ValueError / ValidationError."""
+    title = (fields.get("title") or "").strip()
+    if not title:
+        raise ValueError("title: field required")
+    plan = PlanCreate(
+        title=title,
+        description=(fields.get("description") or "").strip() or None,
+        due_date=(fields.get("due_date") or "").strip() or None,
+    )
+    return {
+        "user_id": user_id,
+        "title": plan.title,
+        "description": plan.description,
+        "created_at": created_at,
+        "due_date": _to_utc_naive(plan.due_date),
+        "is_completed": (fields.get("is_completed") or "").strip().lower() in TRUE_VALUES,
+        "embedding": encode_embedding(vector_store.embed_plan(plan.title, plan.description)),
+    }
+
+
+def _copy_rows(db: Session, rows: List[dict]) -> bool:
+    """COPY rows into plans through the session's connection. Returns False if unsupported."""
+    dbapi_connection = db.connection().connection
+    cursor = dbapi_connection.cursor()
+    if not hasattr(cursor, "copy_expert"):
+        cursor.close()
+        return False
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Unquoted empty fields are NULL in COPY's CSV format.
+        writer.writerow([
+            row["user_id"],
+            row["title"],
+            row["description"],
+            row["created_at"].isoformat(),
+            row["due_date"].isoformat() if row["due_date"] else None,
+            "true" if row["is_completed"] else "false",
+            "\\x" + row["embedding"].hex(),  # bytea hex input format
+        ])
+    buffer.seek(0)
+    try:
+        cursor.copy_expert(f"COPY plans ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    return True
+
+
+def _write_chunk(db: Session, user_id: int, rows: List[dict]) -> int:
+    """Insert one chunk and update per-user counters in a single transaction."""
+    use_copy = db.get_bind().dialect.name == "postgresql"
+    try:
+        if not (use_copy and _copy_rows(db, rows)):
+            db.execute(insert(Plan.__table__), rows)
+        completed = sum(1 for row in rows if row["is_completed"])
+        version = plan_stats.record_bulk_create(db, user_id, len(rows), completed)
+        db.commit()
+        return version
+    except Exception:
+        db.rollback()
+        raise
+
+
+def import_plans(db: Session, user_id: int, stream: IO[str], fmt: str,
+                 chunk_size: int = PLAN_IMPORT_CHUNK_SIZE) -> ImportResult:
+    """Stream-parse a CSV/ICS text stream and bulk-insert its plans for a user."""
+    rows_iter = iter_csv_rows(stream) if fmt == CSV_FORMAT else iter_ics_rows(stream)
+    result = ImportResult()
+    created_at = datetime.utcnow()
+    chunk: List[dict] = []
+    version = None
+
+    def flush():
+        nonlocal version
+        version = _write_chunk(db, user_id, chunk)
+        result.imported += len(chunk)
+        result.chunks += 1
+        chunk.clear()
+
+    try:
+        for line, fields in rows_iter:
+            try:
+                chunk.append(validate_row(user_id, fields, created_at))
+            except ValidationError as e:
+                result.add_error(line, _format_validation_error(e))
+                continue
+            except ValueError as e:
+                result.add_error(line, str(e))
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    except (csv.Error, UnicodeDecodeError) as e:
+        # Chunks already committed stay imported; report where parsing stopped.
+        raise ImportFormatError(f"Could not parse file after {result.imported} imported rows: {e}")
+    finally:
+        if version is not None:
+            plan_cache.on_change(user_id, version)
+            vector_store.invalidate(user_id)
+
+    logger.info(f"Imported {result.imported} plans for user {user_id} in {result.chunks} chunks "
+                f"({result.failed} rows failed).")
+    return result
@@ -0,0 +1,124 @@
+# server/plan_search.py
+# Full-text search over plan titles and descriptions.
+#
+# Postgres: plans.search_vector is a stored generated tsvector (title weighted
+# above description) with a GIN index, so it is maintained on every write.
+# SQLite (tests/dev): an external-content FTS5 table kept in sync by triggers.
+# The search column/table lives outside the ORM model because neither has a
+# portable SQLAlchemy type. On Postgres the column and index come only from
+# alembic migration c5d82b40e9a1 (adding them takes an ACCESS EXCLUSIVE lock,
+# so it must not run at startup); ensure_search_index() creates the SQLite
+# FTS5 table idempotently and only checks that the Postgres column exists.
+
+import re
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TEXT_SEARCH_CONFIG = "english"
+MAX_QUERY_LENGTH = 256
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS plans_fts USING fts5(
+        title, description, content='plans', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS plans_fts_ai AFTER INSERT ON plans BEGIN
+        INSERT INTO plans_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS plans_fts_ad AFTER DELETE ON plans BEGIN
+        INSERT INTO plans_fts(plans_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS plans_fts_au AFTER UPDATE OF title, description ON plans BEGIN
+        INSERT INTO plans_fts(plans_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO plans_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+POSTGRES_SEARCH = f"""
+    SELECT p.id, p.title, p.description, p.created_at, p.due_date, p.is_completed,
+           ts_rank_cd(p.search_vector, q) AS rank
+    FROM plans p, websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', :q) q
+    WHERE p.user_id = :user_id AND p.search_vector @@ q
+    ORDER BY rank DESC, p.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+# bm25() is lower-is-better; negate it so rank sorts the same way as Postgres.
+SQLITE_SEARCH = """
+    SELECT p.id, p.title, p.description, p.created_at, p.due_date, p.is_completed,
+           -bm25(plans_fts, 2.0, 1.0) AS rank
+    FROM plans_fts JOIN plans p ON p.id = plans_fts.rowid
+    WHERE plans_fts MATCH :q AND p.user_id = :user_id
+    ORDER BY rank DESC, p.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def ensure_search_index(engine):
+    """Create the FTS5 table (SQLite) if missing; on Postgres only check the migration ran."""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "postgresql":
+            exists = conn.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'plans' AND column_name = 'search_vector'"
+            )).first()
+            if not exists:
+                logger.warning("plans.search_vector is missing; run `alembic upgrade head` to enable plan search.")
+                return
+        elif dialect == "sqlite":
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'plans_fts'")
+            ).first()
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text("INSERT INTO plans_fts(plans_fts) VALUES ('rebuild')"))
+        else:
+            logger.warning(f"Full-text search is not supported on {dialect}.")
+            return
+    logger.info("Plan search index ready.")
+
+
+def _fts5_query(q: str) -> str:
+    # Quote every term so user input cannot inject FTS5 syntax; the last term
+    # is a prefix match to support search-as-you-type.
+    terms = [t.replace('"', '""') for t in re.findall(r"\w+", q)]
+    if not terms:
+        return ""
+    return " ".join(f'"{t}"' for t in terms[:-1]) + (" " if len(terms) > 1 else "") + f'"{terms[-1]}"*'
+
+
+def search_plans(db: Session, user_id: int, q: str, limit: int, offset: int) -> List[dict]:
+    """Return ranked plans of a user matching q, best match first."""
+    q = q.strip()[:MAX_QUERY_LENGTH]
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = POSTGRES_SEARCH
+    elif dialect == "sqlite":
+        statement = SQLITE_SEARCH
+        q = _fts5_query(q)
+    else:
+        raise RuntimeError(f"Full-text search is not supported on {dialect}")
+    if not q:
+        return []
+
+    rows = db.execute(
+        text(statement), {"q": q, "user_id": user_id, "limit": limit, "offset": offset}
+    ).mappings().all()
+    return [dict(row) for row in rows]
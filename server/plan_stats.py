@@ -0,0 +1,256 @@
+# server/plan_stats.py
+# Incrementally maintained per-user plan statistics (plan_stats table).
+#
+# The record_* hooks are called by the plans router before it commits, so the
+# counters change in the same transaction as the plan itself. Streaks only
+# need a full recount when a completion is undone, a completed plan is
+# deleted, or a completion lands before the last completion day. Run
+# `python plan_stats.py check` / `rebuild` to verify or recompute the table
+# from the plans table.
+
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import logging
+
+from models import Plan, PlanStats, User
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ("total_plans", "completed_plans", "current_streak", "longest_streak", "last_completion_date")
+
+
+def _get_row_for_update(db: Session, user_id: int) -> PlanStats:
+    row = db.query(PlanStats).filter(PlanStats.user_id == user_id).with_for_update().first()
+    if row is not None:
+        return row
+    try:
+        with db.begin_nested():
+            row = PlanStats(user_id=user_id, total_plans=0, completed_plans=0, current_streak=0, longest_streak=0,
+                            version=0)
+            db.add(row)
+        return row
+    except IntegrityError:
+        # Created concurrently by another request.
+        return db.query(PlanStats).filter(PlanStats.user_id == user_id).with_for_update().one()
+
+
+def _streaks(completion_dates: Iterable[date]):
+    """Return (current_streak, longest_streak, last_completion_date) for a set of days."""
+    days = sorted(set(completion_dates))
+    if not days:
+        return 0, 0, None
+    longest = run = 1
+    for previous, day in zip(days, days[1:]):
+        run = run + 1 if day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+    return run, longest, days[-1]
+
+
+def _completion_dates(db: Session, user_id: int) -> List[date]:
+    rows = (
+        db.query(Plan.completed_at)
+        .filter(Plan.user_id == user_id, Plan.is_completed == True, Plan.completed_at.isnot(None))  # noqa: E712
+        .all()
+    )
+    return [r.completed_at.date() for r in rows]
+
+
+def _recount_streaks(db: Session, row: PlanStats):
+    db.flush()
+    row.current_streak, row.longest_streak, row.last_completion_date = _streaks(_completion_dates(db, row.user_id))
+
+
+def _apply_completion(db: Session, row: PlanStats, completed_on: date):
+    if row.last_completion_date == completed_on:
+        return
+    if row.last_completion_date is not None and row.last_completion_date > completed_on:
+        # Out-of-order timestamp (e.g. a completion re-applied to an earlier day).
+        _recount_streaks(db, row)
+        return
+    if row.last_completion_date == completed_on - timedelta(days=1):
+        row.current_streak += 1
+    else:
+        row.current_streak = 1
+    row.last_completion_date = completed_on
+    row.longest_streak = max(row.longest_streak, row.current_streak)
+
+
+# Write hooks -----------------------------------------------------------------
+
+# Each hook also bumps plan_stats.version, the per-user stamp plan_cache uses
+# to validate cached plan lists, and returns the new version.
+
+def record_create(db: Session, plan: Plan) -> int:
+    row = _get_row_for_update(db, plan.user_id)
+    row.total_plans += 1
+    if plan.is_completed:
+        row.completed_plans += 1
+        if plan.completed_at is not None:
+            _apply_completion(db, row, plan.completed_at.date())
+    row.version += 1
+    return row.version
+
+
+def record_bulk_create(db: Session, user_id: int, total: int, completed: int) -> int:
+    """Count a batch of imported plans. Imports carry no completed_at, so streaks are unchanged."""
+    row = _get_row_for_update(db, user_id)
+    row.total_plans += total
+    row.completed_plans += completed
+    row.version += 1
+    return row.version
+
+
+def record_update(db: Session, plan: Plan, was_completed: bool) -> int:
+    """Call after applying the update and before commit."""
+    row = _get_row_for_update(db, plan.user_id)
+    is_completed = bool(plan.is_completed)
+    if is_completed != bool(was_completed):
+        if is_completed:
+            row.completed_plans += 1
+            if plan.completed_at is not None:
+                _apply_completion(db, row, plan.completed_at.date())
+        else:
+            row.completed_plans -= 1
+            _recount_streaks(db, row)
+    row.version += 1
+    return row.version
+
+
+def record_delete(db: Session, plan: Plan) -> int:
+    """Call after db.delete(plan) and before commit."""
+    row = _get_row_for_update(db, plan.user_id)
+    row.total_plans -= 1
+    if plan.is_completed:
+        row.completed_plans -= 1
+        _recount_streaks(db, row)
+    row.version += 1
+    return row.version
+
+
+def get_version(db: Session, user_id: int) -> int:
+    """Current plan-list version for a user (0 before their first write)."""
+    version = db.query(PlanStats.version).filter(PlanStats.user_id == user_id).scalar()
+    return version or 0
+
+
+# Reads -----------------------------------------------------------------------
+
+def get_stats(db: Session, user_id: int, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.utcnow()
+    row = db.query(PlanStats).filter(PlanStats.user_id == user_id).first()
+    if row is None:
+        row = PlanStats(user_id=user_id, total_plans=0, completed_plans=0, current_streak=0, longest_streak=0)
+
+    # Overdue depends on the clock, so it is counted from the partial index
+    # ix_plans_user_due_date_open rather than stored.
+    overdue = (
+        db.query(func.count(Plan.id))
+        .filter(Plan.user_id == user_id, Plan.is_completed == False, Plan.due_date < now)  # noqa: E712
+        .scalar()
+    )
+
+    current_streak = row.current_streak
+    if row.last_completion_date is None or row.last_completion_date < now.date() - timedelta(days=1):
+        current_streak = 0
+
+    return {
+        "total_plans": row.total_plans,
+        "completed_plans": row.completed_plans,
+        "pending_plans": row.total_plans - row.completed_plans,
+        "overdue_plans": overdue,
+        "completion_rate": round(row.completed_plans / row.total_plans, 4) if row.total_plans else 0.0,
+        "current_streak": current_streak,
+        "longest_streak": row.longest_streak,
+        "last_completion_date": row.last_completion_date,
+    }
+
+
+# Maintenance -----------------------------------------------------------------
+
+def compute_stats(db: Session, user_id: int) -> dict:
+    """Aggregate a user's counters from the plans table."""
+    total, completed = (
+        db.query(
+            func.count(Plan.id),
+            func.count(Plan.id).filter(Plan.is_completed == True),  # noqa: E712
+        )
+        .filter(Plan.user_id == user_id)
+        .one()
+    )
+    current, longest, last = _streaks(_completion_dates(db, user_id))
+    return {
+        "total_plans": total,
+        "completed_plans": completed,
+        "current_streak": current,
+        "longest_streak": longest,
+        "last_completion_date": last,
+    }
+
+
+def _user_ids(db: Session, user_id: Optional[int]) -> List[int]:
+    if user_id is not None:
+        return [user_id]
+    return [r.id for r in db.query(User.id).order_by(User.id).all()]
+
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    """Recompute plan_stats from scratch for one user or everyone. Returns rows written."""
+    written = 0
+    for uid in _user_ids(db, user_id):
+        expected = compute_stats(db, uid)
+        row = _get_row_for_update(db, uid)
+        for field in COUNTER_FIELDS:
+            setattr(row, field, expected[field])
+        db.commit()
+        written += 1
+    logger.info(f"Rebuilt plan stats for {written} users.")
+    return written
+
+
+def check_consistency(db: Session, user_id: Optional[int] = None, fix: bool = False) -> List[dict]:
+    """Compare stored counters against the plans table.
+
+    Returns one entry per mismatched user with the stored and expected values;
+    with fix=True the mismatched rows are rewritten.
+    """
+    mismatches = []
+    for uid in _user_ids(db, user_id):
+        expected = compute_stats(db, uid)
+        row = db.query(PlanStats).filter(PlanStats.user_id == uid).first()
+        stored = {field: getattr(row, field) for field in COUNTER_FIELDS} if row else None
+        if stored == expected or (stored is None and expected["total_plans"] == 0):
+            continue
+        mismatches.append({"user_id": uid, "stored": stored, "expected": expected})
+        logger.warning(f"Plan stats mismatch for user {uid}: stored={stored} expected={expected}")
+        if fix:
+            rebuild(db, uid)
+    return mismatches
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the plan_stats summary table.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--fix", action="store_true", help="Rewrite mismatched rows (check only)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt {rebuild(db, args.user_id)} users.")
+        else:
+            mismatches = check_consistency(db, args.user_id, fix=args.fix)
+            for m in mismatches:
+                print(m)
+            print(f"{len(mismatches)} mismatched users.")
+            raise SystemExit(1 if mismatches and not args.fix else 0)
+    finally:
+        db.close()
@@ -0,0 +1,295 @@
+# server/plan_vectors.py
+# Plan embeddings and per-user similarity search.
+#
+# Each plan stores a float32 embedding of its title + description in
+# plans.embedding. Workers keep a brute-force NumPy index per active user
+# (an LRU of users, reloaded after a TTL so writes made by other workers show
+# up) and update it in place on create/update/delete. Per-user plan counts are
+# small enough that a matrix-vector product beats an IVF index here.
+
+import argparse
+import hashlib
+import importlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session, undefer
+import logging
+
+from models import Plan
+from config import (
+    PLAN_EMBEDDER,
+    PLAN_EMBEDDING_DIM,
+    PLAN_DUPLICATE_THRESHOLD,
+    PLAN_VECTOR_CACHE_USERS,
+    PLAN_VECTOR_INDEX_TTL_SECONDS,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """Local embedder using the hashing trick over words, bigrams and char trigrams.
+
+    Hashing uses blake2b rather than hash() so embeddings are stable across
+    processes and can be stored.
+    """
+
+    def __init__(self, dim: int = PLAN_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text: str):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        for token in tokens:
+            yield token, 1.0
+            padded = f"<{token}>"
+            for i in range(len(padded) - 2):
+                yield "#" + padded[i:i + 3], 0.5
+        for a, b in zip(tokens, tokens[1:]):
+            yield f"{a} {b}", 1.0
+
+    def embed(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += weight if (h >> 63) & 1 else -weight
+        vec = np.sign(vec) * np.log1p(np.abs(vec))
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+
+def load_embedder(spec: str = PLAN_EMBEDDER, dim: int = PLAN_EMBEDDING_DIM):
+    """Build the embedder named by PLAN_EMBEDDER: "hashing" or "package.module:factory".
+
+    A custom factory is called with dim= and must return an object with
+    .dim and .embed(text) -> 1-D float array.
+    """
+    if spec == "hashing":
+        return HashingEmbedder(dim)
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory(dim=dim)
+
+
+def plan_text(title: Optional[str], description: Optional[str]) -> str:
+    return f"{title or ''}\n{description or ''}"
+
+
+def encode(vec: np.ndarray) -> bytes:
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+
+def decode(blob: Optional[bytes], dim: int) -> Optional[np.ndarray]:
+    if blob is None or len(blob) != dim * 4:
+        return None
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class UserVectorIndex:
+    """Growable float32 matrix of one user's plan embeddings."""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._positions = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes + self._ids.nbytes
+
+    def upsert(self, plan_id: int, vec: np.ndarray):
+        pos = self._positions.get(plan_id)
+        if pos is None:
+            if self.size == len(self._ids):
+                self._grow()
+            pos = self.size
+            self.size += 1
+            self._ids[pos] = plan_id
+            self._positions[plan_id] = pos
+        self._matrix[pos] = vec
+
+    def remove(self, plan_id: int):
+        pos = self._positions.pop(plan_id, None)
+        if pos is None:
+            return
+        last = self.size - 1
+        if pos != last:
+            # Swap-remove keeps the live rows contiguous.
+            self._matrix[pos] = self._matrix[last]
+            self._ids[pos] = self._ids[last]
+            self._positions[int(self._ids[pos])] = pos
+        self.size = last
+
+    def _grow(self):
+        capacity = max(16, len(self._ids) * 2)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        matrix[:self.size] = self._matrix[:self.size]
+        ids[:self.size] = self._ids[:self.size]
+        self._matrix, self._ids = matrix, ids
+
+    def query(self, vec: np.ndarray, k: int, min_score: float, exclude_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Return up to k (plan_id, cosine score) pairs with score >= min_score, best first."""
+        if self.size == 0:
+            return []
+        scores = self._matrix[:self.size] @ vec
+        if exclude_id is not None and exclude_id in self._positions:
+            scores[self._positions[exclude_id]] = -np.inf
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+class PlanVectorStore:
+    def __init__(self, embedder, max_users: int = PLAN_VECTOR_CACHE_USERS, ttl_seconds: int = PLAN_VECTOR_INDEX_TTL_SECONDS):
+        self.embedder = embedder
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._indexes: "OrderedDict[int, Tuple[float, UserVectorIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_plan(self, title: Optional[str], description: Optional[str]) -> np.ndarray:
+        return np.asarray(self.embedder.embed(plan_text(title, description)), dtype=np.float32)
+
+    def _load(self, db: Session, user_id: int) -> UserVectorIndex:
+        rows = db.query(Plan.id, Plan.title, Plan.description, Plan.embedding).filter(Plan.user_id == user_id).all()
+        index = UserVectorIndex(self.embedder.dim, capacity=max(16, len(rows)))
+        missing = []
+        for row in rows:
+            vec = decode(row.embedding, self.embedder.dim)
+            if vec is None:
+                # Plans created before embeddings (or with another dim); see `backfill`.
+                vec = self.embed_plan(row.title, row.description)
+                if row.embedding is None:
+                    missing.append({"plan_id": row.id, "embedding": encode(vec)})
+            index.upsert(row.id, vec)
+        if missing:
+            self._store_embeddings(db, user_id, missing)
+        return index
+
+    def _store_embeddings(self, db: Session, user_id: int, embeddings: List[dict], batch_size: int = 1000):
+        """Persist embeddings computed on load so the next load does not redo them.
+
+        Written in its own transaction so read-only callers still keep them;
+        `embedding IS NULL` skips plans updated since they were read.
+        """
+        table = Plan.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("plan_id"), table.c.embedding.is_(None))
+            .values(embedding=bindparam("embedding"))
+        )
+        try:
+            with db.get_bind().begin() as conn:
+                for start in range(0, len(embeddings), batch_size):
+                    conn.execute(statement, embeddings[start:start + batch_size])
+            logger.debug(f"Stored {len(embeddings)} missing embeddings for user {user_id}.")
+        except Exception as e:
+            logger.warning(f"Could not store embeddings for user {user_id}: {e}")
+
+    def get_index(self, db: Session, user_id: int) -> UserVectorIndex:
+        with self._lock:
+            entry = self._indexes.get(user_id)
+            if entry is not None and time.time() - entry[0] < self.ttl_seconds:
+                self._indexes.move_to_end(user_id)
+                return entry[1]
+        # Load outside the lock so one user's cold start does not block others.
+        index = self._load(db, user_id)
+        with self._lock:
+            self._indexes[user_id] = (time.time(), index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+            return index
+
+    def on_upsert(self, user_id: int, plan_id: int, vec: np.ndarray):
+        """Apply a committed create/update to the user's index if it is loaded."""
+        with self._lock:
+            entry = self._indexes.get(user_id)
+            if entry is not None:
+                entry[1].upsert(plan_id, vec)
+
+    def on_delete(self, user_id: int, plan_id: int):
+        with self._lock:
+            entry = self._indexes.get(user_id)
+            if entry is not None:
+                entry[1].remove(plan_id)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        with self._lock:
+            if user_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(user_id, None)
+
+    def similar(self, db: Session, user_id: int, vec: np.ndarray, k: int = 5, min_score: float = 0.3,
+                exclude_id: Optional[int] = None) -> List[dict]:
+        """Return similar plans as dicts with id, title and score, best first."""
+        index = self.get_index(db, user_id)
+        with self._lock:
+            matches = index.query(vec, k, min_score, exclude_id)
+        if not matches:
+            return []
+        titles = dict(db.query(Plan.id, Plan.title).filter(Plan.id.in_([m[0] for m in matches])).all())
+        return [
+            {"id": plan_id, "title": titles[plan_id], "score": round(score, 4)}
+            for plan_id, score in matches
+            if plan_id in titles
+        ]
+
+    def possible_duplicates(self, db: Session, user_id: int, vec: np.ndarray, exclude_id: Optional[int] = None) -> List[dict]:
+        return self.similar(db, user_id, vec, k=3, min_score=PLAN_DUPLICATE_THRESHOLD, exclude_id=exclude_id)
+
+
+def backfill(db: Session, store: "PlanVectorStore", batch_size: int = 1000) -> int:
+    """Store embeddings for plans that have none (or a different dimension)."""
+    updated = 0
+    last_id = 0
+    while True:
+        plans = (
+            db.query(Plan).options(undefer(Plan.embedding))
+            .filter(Plan.id > last_id).order_by(Plan.id).limit(batch_size).all()
+        )
+        if not plans:
+            break
+        for plan in plans:
+            if decode(plan.embedding, store.embedder.dim) is None:
+                plan.embedding = encode(store.embed_plan(plan.title, plan.description))
+                updated += 1
+        db.commit()
+        last_id = plans[-1].id
+    store.invalidate()
+    logger.info(f"Backfilled embeddings for {updated} plans.")
+    return updated
+
+
+vector_store = PlanVectorStore(load_embedder())
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain plan embeddings.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(f"Backfilled {backfill(db, vector_store, args.batch_size)} plans.")
+    finally:
+        db.close()
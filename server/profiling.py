@@ -0,0 +1,339 @@
+# server/profiling.py
+# On-demand request profiling and slow-query capture.
+#
+# ProfilingMiddleware picks requests to profile: an admin sending
+# "X-Profile: 1", or a random sample at PROFILING_SAMPLE_RATE. The chosen
+# request's profile lives in a context variable, which Starlette copies into
+# the threadpool. ProfiledRoute wraps each endpoint, so the call tree is
+# recorded on the thread that actually runs the handler. SQL timings come from
+# cursor events on database.engine. Slow statements are kept for every request,
+# not only sampled ones. Finished profiles go to a bounded ring buffer that
+# routers/admin.py exposes.
+
+import asyncio
+import contextvars
+import cProfile
+import functools
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+import jwt
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+import logging
+
+from config import (
+    JWT_SECRET,
+    JWT_ALGORITHM,
+    ADMIN_EMAILS,
+    PROFILING_ENABLED,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_BUFFER_SIZE,
+    PROFILING_SLOW_QUERY_MS,
+    PROFILING_N_PLUS_ONE_THRESHOLD,
+    PROFILER,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+EXCLUDED_PREFIXES = ("/admin", "/docs", "/redoc", "/openapi.json")
+MAX_STATEMENTS = 500
+CALL_TREE_LINES = 60
+
+current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+def is_admin_email(email: Optional[str]) -> bool:
+    return bool(email) and email.lower() in ADMIN_EMAILS
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Check the JWT's subject against ADMIN_EMAILS without a database lookup."""
+    if not token:
+        return False
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.PyJWTError:
+        return False
+    return is_admin_email(payload.get("sub"))
+
+
+class RequestProfile:
+    def __init__(self, profile_id: int, method: str, path: str, trigger: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger  # "header" or "sample"
+        self.started_at = datetime.utcnow()
+        self.duration_ms: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.statements: List[dict] = []
+        self.dropped_statements = 0
+        self.call_tree: Optional[str] = None
+        self.download: Optional[bytes] = None
+        self.download_type = "application/octet-stream"
+        self.download_ext = "prof"
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def add_statement(self, statement: str, duration_ms: float):
+        with self._lock:
+            if len(self.statements) >= MAX_STATEMENTS:
+                self.dropped_statements += 1
+                return
+            self.statements.append({"statement": statement, "duration_ms": round(duration_ms, 3)})
+
+    @contextmanager
+    def profiling(self):
+        """Profile the enclosed call on the current thread."""
+        if PROFILER == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed; falling back to cProfile.")
+            else:
+                profiler = Profiler()
+                profiler.start()
+                try:
+                    yield
+                finally:
+                    profiler.stop()
+                    self.call_tree = profiler.output_text(unicode=True)
+                    self.download = profiler.output_html().encode("utf-8")
+                    self.download_type, self.download_ext = "text/html", "html"
+                return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; keep SQL timings only.
+            self.call_tree = "Call tree unavailable: another request was being profiled."
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            out = io.StringIO()
+            stats = pstats.Stats(profiler, stream=out)
+            stats.sort_stats("cumulative").print_stats(CALL_TREE_LINES)
+            self.call_tree = out.getvalue()
+            # Same format as pstats.dump_stats(), loadable by snakeviz/pstats.
+            self.download = marshal.dumps(stats.stats)
+
+    def finish(self, status_code: Optional[int]):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        self.status_code = status_code
+
+    def flags(self) -> dict:
+        counts = Counter(s["statement"] for s in self.statements)
+        return {
+            "n_plus_one": [
+                {"statement": statement, "count": count}
+                for statement, count in counts.most_common()
+                if count >= PROFILING_N_PLUS_ONE_THRESHOLD
+            ],
+            "slow_queries": [s for s in self.statements if s["duration_ms"] >= PROFILING_SLOW_QUERY_MS],
+        }
+
+    def summary(self) -> dict:
+        flags = self.flags()
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status_code": self.status_code,
+            "sql_count": len(self.statements) + self.dropped_statements,
+            "sql_ms": round(sum(s["duration_ms"] for s in self.statements), 3),
+            "n_plus_one": len(flags["n_plus_one"]),
+            "slow_queries": len(flags["slow_queries"]),
+        }
+
+    def detail(self) -> dict:
+        data = self.summary()
+        data.update({
+            "statements": self.statements,
+            "dropped_statements": self.dropped_statements,
+            "flags": self.flags(),
+            "call_tree": self.call_tree,
+        })
+        return data
+
+
+class ProfileStore:
+    """Ring buffers of recent request profiles and slow statements."""
+
+    def __init__(self, size: int):
+        self._profiles = deque(maxlen=size)
+        self._slow_queries = deque(maxlen=size * 4)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_profile(self, method: str, path: str, trigger: str) -> RequestProfile:
+        return RequestProfile(next(self._ids), method, path, trigger)
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def add_slow_query(self, statement: str, duration_ms: float):
+        profile = current_profile.get()
+        with self._lock:
+            self._slow_queries.append({
+                "statement": statement,
+                "duration_ms": round(duration_ms, 3),
+                "at": datetime.utcnow(),
+                "profile_id": profile.id if profile else None,
+            })
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            profiles = list(self._profiles)
+        return [p.summary() for p in reversed(profiles)]
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def slow_queries(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self._slow_queries))
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+            self._slow_queries.clear()
+
+
+profile_store = ProfileStore(PROFILING_BUFFER_SIZE)
+
+
+# SQL capture -----------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the per-statement context rather than the pooled connection, so
+    # a statement that raises (no after_cursor_execute) leaves nothing behind.
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start_time", None)
+    if start is None:
+        return
+    duration_ms = (time.perf_counter() - start) * 1000
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_statement(statement, duration_ms)
+    if duration_ms >= PROFILING_SLOW_QUERY_MS:
+        logger.warning(f"Slow query ({duration_ms:.1f} ms): {statement}")
+        profile_store.add_slow_query(statement, duration_ms)
+
+
+def install_sql_hooks(engine):
+    """Attach timing listeners to an engine. Parameters are never recorded."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        logger.info("SQL profiling hooks installed.")
+
+
+# Request hooks ---------------------------------------------------------------
+
+def _wrap_endpoint(endpoint):
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            # Note: on the event loop this also records other tasks' work.
+            with profile.profiling():
+                return await endpoint(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        with profile.profiling():
+            return endpoint(*args, **kwargs)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute that profiles its endpoint when the current request is sampled."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _wrap_endpoint(endpoint), **kwargs)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, sample_rate: float = PROFILING_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    def _trigger(self, scope) -> Optional[str]:
+        path = scope.get("path", "")
+        if path.startswith(EXCLUDED_PREFIXES):
+            return None
+        headers = dict(scope.get("headers") or [])
+        if headers.get(PROFILE_HEADER) in (b"1", b"true"):
+            token = headers.get(b"token")
+            if is_admin_token(token.decode("latin-1") if token else None):
+                return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = profile_store.new_profile(scope["method"], scope["path"], trigger)
+        status = {}
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER, str(profile.id).encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        reset_token = current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            current_profile.reset(reset_token)
+            profile.finish(status.get("code"))
+            profile_store.add(profile)
+            logger.info(f"Profiled {profile.method} {profile.path} ({trigger}): "
+                        f"{profile.duration_ms} ms, {len(profile.statements)} SQL statements")
@@ -0,0 +1,438 @@
+# server/reminders.py
+# Server-side due-date reminders.
+#
+# A single leader (Postgres advisory lock, or a local file lock on other
+# databases) periodically scans open plans through the partial index
+# ix_plans_due_date_open in keyset-paginated batches. Each plan that needs a
+# reminder is pushed onto an in-process heap scheduler at its fire time, and
+# fired reminders are sent to the configured sinks.
+
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional
+
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+import logging
+
+from models import Plan
+from config import (
+    REMINDER_SINKS,
+    REMINDER_WEBHOOK_URL,
+    REMINDER_SCAN_INTERVAL_SECONDS,
+    REMINDER_LEAD_MINUTES,
+    REMINDER_OVERDUE_LOOKBACK_HOURS,
+    REMINDER_BATCH_SIZE,
+    REMINDER_LOCK_FILE,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+UPCOMING = "upcoming"
+OVERDUE = "overdue"
+ADVISORY_LOCK_KEY = 0x706C616E  # "plan"
+
+
+class ReminderEvent:
+    def __init__(self, kind: str, plan_id: int, user_id: int, title: str, due_date: datetime, emitted_at: datetime):
+        self.kind = kind
+        self.plan_id = plan_id
+        self.user_id = user_id
+        self.title = title
+        self.due_date = due_date
+        self.emitted_at = emitted_at
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "plan_id": self.plan_id,
+            "user_id": self.user_id,
+            "title": self.title,
+            "due_date": self.due_date.isoformat(),
+            "emitted_at": self.emitted_at.isoformat(),
+        }
+
+
+# Sinks -----------------------------------------------------------------------
+
+class LogSink:
+    def emit(self, event: ReminderEvent):
+        logger.info(f"Reminder ({event.kind}) for plan {event.plan_id} of user {event.user_id}: "
+                    f"'{event.title}' due {event.due_date.isoformat()}")
+
+
+class WebhookSink:
+    """POSTs each event as JSON. Delivery is best effort, without retries."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def emit(self, event: ReminderEvent):
+        data = json.dumps(event.to_dict()).encode("utf-8")
+        request = urllib.request.Request(self.url, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                logger.debug(f"Reminder webhook responded with {response.status}.")
+        except Exception as e:
+            logger.error(f"Error delivering reminder webhook for plan {event.plan_id}: {e}")
+
+
+def build_sinks(names: str = REMINDER_SINKS) -> list:
+    sinks = []
+    for name in (n.strip() for n in names.split(",")):
+        if name == "log":
+            sinks.append(LogSink())
+        elif name == "webhook":
+            if REMINDER_WEBHOOK_URL:
+                sinks.append(WebhookSink(REMINDER_WEBHOOK_URL))
+            else:
+                logger.warning("Webhook reminder sink requested but REMINDER_WEBHOOK_URL is not set.")
+        elif name:
+            logger.warning(f"Unknown reminder sink: {name}")
+    return sinks
+
+
+# Scheduler -------------------------------------------------------------------
+
+class HeapScheduler:
+    """Runs callbacks at wall-clock times on a single background thread.
+
+    Jobs are keyed; scheduling an existing key replaces the previous entry
+    (stale heap entries are skipped lazily when popped).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._live = {}  # key -> sequence number of the current entry
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def schedule(self, run_at: float, key, callback: Callable[[], None]):
+        with self._cond:
+            seq = next(self._counter)
+            self._live[key] = seq
+            heapq.heappush(self._heap, (run_at, seq, key, callback))
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._live.pop(key, None)
+
+    def __len__(self):
+        return len(self._live)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    run_at, seq, key, callback = self._heap[0]
+                    if self._live.get(key) != seq:
+                        heapq.heappop(self._heap)
+                        continue
+                    delay = run_at - time.time()
+                    if delay <= 0:
+                        heapq.heappop(self._heap)
+                        del self._live[key]
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error running scheduled job {key}: {e}", exc_info=True)
+
+
+# Leader election -------------------------------------------------------------
+
+class AdvisoryLeaderLock:
+    """Session-level pg_try_advisory_lock held on a dedicated connection."""
+
+    def __init__(self, engine, key: int = ADVISORY_LOCK_KEY):
+        self.engine = engine
+        self.key = key
+        self._conn = None
+
+    def acquire(self) -> bool:
+        if self._conn is not None:
+            return True
+        conn = self.engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if acquired:
+            self._conn = conn
+            return True
+        conn.close()
+        return False
+
+    def is_held(self) -> bool:
+        """Check the session holding the lock is still alive; the lock dies with it."""
+        if self._conn is None:
+            return False
+        try:
+            self._conn.execute(text("SELECT 1"))
+            self._conn.commit()
+            return True
+        except Exception as e:
+            logger.warning(f"Reminder leader connection lost: {e}")
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+            return False
+
+    def release(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            self._conn.commit()
+        finally:
+            self._conn.close()
+            self._conn = None
+
+
+class FileLeaderLock:
+    """Non-blocking flock on a local file; only covers workers on one host."""
+
+    def __init__(self, path: str = REMINDER_LOCK_FILE):
+        self.path = path
+        self._fd = None
+
+    def acquire(self) -> bool:
+        import fcntl
+
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def is_held(self) -> bool:
+        return self._fd is not None
+
+    def release(self):
+        import fcntl
+
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+def build_leader_lock(engine):
+    if engine.dialect.name == "postgresql":
+        return AdvisoryLeaderLock(engine)
+    return FileLeaderLock()
+
+
+# Reminder service ------------------------------------------------------------
+
+def next_reminder(due_date: datetime, last_reminded_at: Optional[datetime], now: datetime, lead: timedelta):
+    """Return (kind, fire_at) for the next reminder a plan needs, or None."""
+    if due_date <= now:
+        if last_reminded_at is None or last_reminded_at < due_date:
+            return OVERDUE, now
+        return None
+    if last_reminded_at is None:
+        return UPCOMING, max(due_date - lead, now)
+    return OVERDUE, due_date
+
+
+class ReminderService:
+    def __init__(
+        self,
+        session_factory,
+        sinks: list,
+        leader_lock,
+        scheduler: Optional[HeapScheduler] = None,
+        scan_interval: int = REMINDER_SCAN_INTERVAL_SECONDS,
+        lead: timedelta = timedelta(minutes=REMINDER_LEAD_MINUTES),
+        lookback: timedelta = timedelta(hours=REMINDER_OVERDUE_LOOKBACK_HOURS),
+        batch_size: int = REMINDER_BATCH_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.sinks = sinks
+        self.leader_lock = leader_lock
+        self.scheduler = scheduler or HeapScheduler()
+        self.scan_interval = scan_interval
+        self.lead = lead
+        self.lookback = lookback
+        self.batch_size = batch_size
+        self.is_leader = False
+
+    def start(self):
+        logger.info("Starting reminder scheduler.")
+        self.scheduler.start()
+        self.scheduler.schedule(time.time(), "scan", self._scan_job)
+
+    def stop(self):
+        logger.info("Stopping reminder scheduler.")
+        self.scheduler.stop()
+        if self.is_leader:
+            self.leader_lock.release()
+            self.is_leader = False
+
+    def iter_due_batches(self, db: Session, now: datetime) -> Iterator[List[tuple]]:
+        """Yield batches of (id, due_date, last_reminded_at) for open plans needing a reminder.
+
+        The is_completed/due_date predicates match ix_plans_due_date_open, and
+        (due_date, id) keyset pagination keeps each batch an index range scan.
+        """
+        horizon = now + self.lead + timedelta(seconds=self.scan_interval)
+        cursor = None
+        while True:
+            query = (
+                db.query(Plan.id, Plan.due_date, Plan.last_reminded_at)
+                .filter(
+                    Plan.is_completed == False,  # noqa: E712
+                    Plan.due_date >= now - self.lookback,
+                    Plan.due_date <= horizon,
+                    or_(Plan.last_reminded_at.is_(None), Plan.last_reminded_at < Plan.due_date),
+                )
+            )
+            if cursor is not None:
+                query = query.filter(or_(
+                    Plan.due_date > cursor[0],
+                    and_(Plan.due_date == cursor[0], Plan.id > cursor[1]),
+                ))
+            rows = query.order_by(Plan.due_date, Plan.id).limit(self.batch_size).all()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.batch_size:
+                return
+            cursor = (rows[-1].due_date, rows[-1].id)
+
+    def scan(self) -> int:
+        """Schedule reminders for every plan due within the scan horizon. Returns the number scheduled."""
+        now = datetime.utcnow()
+        scheduled = 0
+        db = self.session_factory()
+        try:
+            for batch in self.iter_due_batches(db, now):
+                for plan_id, due_date, last_reminded_at in batch:
+                    action = next_reminder(due_date, last_reminded_at, now, self.lead)
+                    if action is None:
+                        continue
+                    self._schedule_plan(plan_id, action[1], now)
+                    scheduled += 1
+        finally:
+            db.close()
+        logger.debug(f"Reminder scan scheduled {scheduled} plans.")
+        return scheduled
+
+    def _schedule_plan(self, plan_id: int, fire_at: datetime, now: datetime):
+        run_at = time.time() + max((fire_at - now).total_seconds(), 0)
+        self.scheduler.schedule(run_at, ("plan", plan_id), lambda: self.fire(plan_id))
+
+    def _scan_job(self):
+        try:
+            if self.is_leader and not self.leader_lock.is_held():
+                logger.warning("Lost reminder leader lock.")
+                self.is_leader = False
+            if not self.is_leader:
+                self.is_leader = self.leader_lock.acquire()
+                if self.is_leader:
+                    logger.info("Acquired reminder leader lock.")
+            if self.is_leader:
+                self.scan()
+        except Exception as e:
+            logger.error(f"Error during reminder scan: {e}", exc_info=True)
+        finally:
+            self.scheduler.schedule(time.time() + self.scan_interval, "scan", self._scan_job)
+
+    def fire(self, plan_id: int) -> Optional[ReminderEvent]:
+        """Re-check a plan and emit its reminder if it is still due."""
+        db = self.session_factory()
+        try:
+            plan = db.query(Plan).filter(Plan.id == plan_id).first()
+            if plan is None or plan.is_completed or plan.due_date is None:
+                return None
+            now = datetime.utcnow()
+            action = next_reminder(plan.due_date, plan.last_reminded_at, now, self.lead)
+            if action is None:
+                return None
+            kind, fire_at = action
+            if fire_at > now:
+                # Rescheduled (e.g. due date moved) since this job was queued.
+                self._schedule_plan(plan.id, fire_at, now)
+                return None
+
+            # Claim the reminder with a conditional update so a second worker
+            # (or a stale leader) that read the same row cannot emit it again.
+            claimed = (
+                db.query(Plan)
+                .filter(
+                    Plan.id == plan.id,
+                    Plan.is_completed == False,  # noqa: E712
+                    Plan.due_date == plan.due_date,
+                    Plan.last_reminded_at.is_(None) if plan.last_reminded_at is None
+                    else Plan.last_reminded_at == plan.last_reminded_at,
+                    or_(Plan.last_reminded_at.is_(None), Plan.last_reminded_at < Plan.due_date),
+                )
+                .update({"last_reminded_at": now}, synchronize_session=False)
+            )
+            db.commit()
+            if claimed != 1:
+                logger.debug(f"Reminder for plan {plan.id} already claimed.")
+                return None
+
+            event = ReminderEvent(kind, plan.id, plan.user_id, plan.title, plan.due_date, now)
+            for sink in self.sinks:
+                try:
+                    sink.emit(event)
+                except Exception as e:
+                    logger.error(f"Reminder sink {type(sink).__name__} failed: {e}")
+
+            if kind == UPCOMING:
+                self._schedule_plan(plan.id, plan.due_date, now)
+            return event
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error firing reminder for plan {plan_id}: {e}", exc_info=True)
+            return None
+        finally:
+            db.close()
@@ -0,0 +1,72 @@
+# server/routers/admin.py
+# Admin-only instrumentation: request profiles, slow queries, cache and AI gateway stats.
+# Access is limited to users whose email is listed in ADMIN_EMAILS.
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from sqlalchemy.orm import Session
+import logging
+
+from database import get_db
+from routers.plans import get_current_user
+from profiling import ProfiledRoute, profile_store, is_admin_email
+from plan_cache import plan_cache
+from ai_gateway import ai_gateway
+
+router = APIRouter(prefix="/admin", tags=["Admin"], route_class=ProfiledRoute)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def require_admin(token: str = Header(None), db: Session = Depends(get_db)):
+    user = get_current_user(token, db)
+    if not user:
+        logger.warning("Unauthorized attempt to access admin endpoint.")
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if not is_admin_email(user.email):
+        logger.warning(f"Non-admin user attempted admin access: {user.email}")
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+@router.get("/profiles")
+def list_profiles(admin=Depends(require_admin)):
+    logger.debug("Listing request profiles.")
+    return profile_store.list()
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: int, admin=Depends(require_admin)):
+    logger.debug(f"Fetching request profile: {profile_id}")
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.detail()
+
+@router.get("/profiles/{profile_id}/download")
+def download_profile(profile_id: int, admin=Depends(require_admin)):
+    logger.debug(f"Downloading request profile: {profile_id}")
+    profile = profile_store.get(profile_id)
+    if not profile or profile.download is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=profile.download,
+        media_type=profile.download_type,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.{profile.download_ext}"'}
+    )
+
+@router.delete("/profiles")
+def clear_profiles(admin=Depends(require_admin)):
+    profile_store.clear()
+    logger.info(f"Profiles cleared by {admin.email}.")
+    return {"message": "Profiles cleared"}
+
+@router.get("/slow-queries")
+def get_slow_queries(admin=Depends(require_admin)):
+    logger.debug("Listing slow queries.")
+    return profile_store.slow_queries()
+
+@router.get("/cache-stats")
+def get_cache_stats(admin=Depends(require_admin)):
+    return {"plans": plan_cache.stats()}
+
+@router.get("/ai-stats")
+def get_ai_stats(admin=Depends(require_admin)):
+    return ai_gateway.stats()
@@ -1,51 +1,116 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import List
 import logging
 from config import OPENAI_API_KEY
 import openai
 from openai import APIError
+from database import get_db
+from models import Plan
+from routers.plans import get_current_user
+from ai_gateway import ai_gateway, GatewayError
+from profiling import ProfiledRoute
 
 # Ensure the API key is set before initializing the client
 if not OPENAI_API_KEY:
     raise ValueError("OpenAI API key not configured.")
 
-openai.api_key = OPENAI_API_KEY
-
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.debug(f"OpenAI library version: {openai.__version__}")
 
-router = APIRouter(prefix="/ai", tags=["AI"])
+router = APIRouter(prefix="/ai", tags=["AI"], route_class=ProfiledRoute)
 
 class ChatRequest(BaseModel):
     prompt: str
 
-@router.post("/chat")
-def chat_with_ai(chat_request: ChatRequest):
-    prompt = chat_request.prompt
-    logger.debug(f"Received prompt for AI chat: {prompt}")
-    try:
-        logger.debug("Sending prompt to OpenAI ChatCompletion API.")
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150,
-            temperature=0.7
-        )
-
-        reply = response.choices[0].message.content.strip()
-        logger.debug(f"Received reply from AI: {reply}")
-        return {"reply": reply}
-    except APIError as e:
+class PlanSummary(BaseModel):
+    plan_id: int
+    summary: str
+
+class PlanSummariesOut(BaseModel):
+    summaries: List[PlanSummary]
+    missing: List[int]
+    batches: int
+    models: List[str]
+
+def raise_for_ai_error(e: Exception):
+    """Translate gateway and upstream errors into HTTP errors."""
+    if isinstance(e, GatewayError):
+        logger.warning(f"AI gateway rejected request: {e.detail}")
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+    if isinstance(e, APIError):
         logger.error(f"OpenAI API error: {e}")
         if "insufficient_quota" in str(e):
             raise HTTPException(status_code=429, detail="You exceeded your current quota. Please check your plan and billing details.")
         if "model_not_found" in str(e):
             raise HTTPException(status_code=500, detail="Invalid model specified")
         raise HTTPException(status_code=500, detail="Error communicating with OpenAI API")
+    raise e
+
+@router.post("/chat")
+def chat_with_ai(
+    chat_request: ChatRequest,
+    db: Session = Depends(get_db),
+    token: str = Header(None)
+):
+    prompt = chat_request.prompt
+    logger.debug(f"Received prompt for AI chat: {prompt}")
+    try:
+        user = get_current_user(token, db)
+        if not user:
+            logger.warning("Unauthorized attempt to use AI chat.")
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        # Return the DB connection to the pool before waiting on the upstream.
+        db.close()
+
+        logger.debug("Sending prompt through the AI gateway.")
+        result = ai_gateway.chat(prompt)
+        logger.debug(f"Received reply from AI ({result['model']}): {result['reply']}")
+        return result
+    except HTTPException as he:
+        logger.error(f"HTTPException: {he.detail}")
+        raise he
+    except (GatewayError, APIError) as e:
+        raise_for_ai_error(e)
     except Exception as e:
         logger.error(f"Unexpected error in AI chat: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/summarize-plans", response_model=PlanSummariesOut)
+def summarize_plans(
+    include_completed: bool = Query(False),
+    limit: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    token: str = Header(None)
+):
+    logger.debug("Summarizing plans.")
+    try:
+        user = get_current_user(token, db)
+        if not user:
+            logger.warning("Unauthorized attempt to summarize plans.")
+            raise HTTPException(status_code=401, detail="Not authenticated")
+
+        query = db.query(Plan).filter(Plan.user_id == user.id)
+        if not include_completed:
+            query = query.filter(Plan.is_completed == False)  # noqa: E712
+        plans = query.order_by(Plan.id).limit(limit).all()
+        if not plans:
+            return {"summaries": [], "missing": [], "batches": 0, "models": []}
+        # Return the DB connection to the pool before waiting on the upstream.
+        db.close()
+
+        result = ai_gateway.summarize_plans(plans)
+        logger.info(f"Summarized {len(result['summaries'])} plans for user {user.email} "
+                    f"in {result['batches']} AI calls.")
+        return result
+    except HTTPException as he:
+        logger.error(f"HTTPException: {he.detail}")
+        raise he
+    except (GatewayError, APIError) as e:
+        raise_for_ai_error(e)
+    except Exception as e:
+        logger.error(f"Unexpected error summarizing plans: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -12,8 +12,9 @@ from database import get_db
 from models import User
 from schemas import UserCreate, UserLogin, UserOut
 from config import JWT_SECRET, JWT_ALGORITHM
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/auth", tags=["Auth"])
+router = APIRouter(prefix="/auth", tags=["Auth"], route_class=ProfiledRoute)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Configure logging
@@ -2,7 +2,7 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import json
 import jwt
 import logging
@@ -11,8 +11,10 @@ from database import get_db
 from models import QuestionnaireResponse, User
 from schemas import QuestionnaireResponseCreate, QuestionnaireResponseOut
 from config import JWT_SECRET, JWT_ALGORITHM
+from idempotency import idempotency_store
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/onboarding", tags=["Onboarding"])
+router = APIRouter(prefix="/onboarding", tags=["Onboarding"], route_class=ProfiledRoute)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -45,32 +47,41 @@ def get_current_user(token: str = Header(None), db: Session = Depends(get_db)):
 def submit_questionnaire(
     questionnaire: QuestionnaireResponseCreate,
     db: Session = Depends(get_db),
-    token: str = Header(None)
+    token: str = Header(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
     logger.debug("Submitting questionnaire responses.")
     try:
-        user = get_current_user(token, db)
-        if not user:
-            logger.warning("Unauthorized attempt to submit questionnaire.")
-            raise HTTPException(status_code=401, detail="Not authenticated")
+        scope = idempotency_store.make_scope("POST", "/onboarding/submit", token)
+        with idempotency_store.guard(db, idempotency_key, scope, questionnaire) as guard:
+            if guard.replay is not None:
+                logger.info("Replaying stored response for questionnaire submission.")
+                return guard.replay
 
-        # Validate and serialize responses
-        responses_json = json.dumps(questionnaire.responses)
+            user = get_current_user(token, db)
+            if not user:
+                logger.warning("Unauthorized attempt to submit questionnaire.")
+                raise HTTPException(status_code=401, detail="Not authenticated")
 
-        questionnaire_response = QuestionnaireResponse(
-            user_id=user.id,
-            responses=responses_json
-        )
-        db.add(questionnaire_response)
-        db.commit()
-        db.refresh(questionnaire_response)
-        logger.info(f"Questionnaire response saved for user {user.email}.")
-        return QuestionnaireResponseOut(
-            id=questionnaire_response.id,
-            user_id=questionnaire_response.user_id,
-            responses=questionnaire.responses,
-            created_at=questionnaire_response.created_at
-        )
+            # Validate and serialize responses
+            responses_json = json.dumps(questionnaire.responses)
+
+            questionnaire_response = QuestionnaireResponse(
+                user_id=user.id,
+                responses=responses_json
+            )
+            db.add(questionnaire_response)
+            db.flush()
+            response_out = QuestionnaireResponseOut(
+                id=questionnaire_response.id,
+                user_id=questionnaire_response.user_id,
+                responses=questionnaire.responses,
+                created_at=questionnaire_response.created_at
+            )
+            guard.record(response_out)
+            db.commit()
+            logger.info(f"Questionnaire response saved for user {user.email}.")
+            return response_out
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -1,17 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Path, Body
+from fastapi import APIRouter, Depends, HTTPException, Header, Path, Body, Query, Response, UploadFile, File
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timezone
+import io
 import jwt
 import logging
 
 from database import get_db
-from schemas import PlanCreate, PlanOut
+from schemas import PlanCreate, PlanCreateOut, PlanOut, PlanStatsOut, PlanSearchResults, SimilarPlan, PlanImportResult
 from models import Plan, User
 from config import JWT_SECRET, JWT_ALGORITHM
+from idempotency import idempotency_store
+import plan_stats
+import plan_search
+import plan_import
+from plan_vectors import vector_store, encode as encode_embedding
+from plan_cache import plan_cache, encode_json
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/plans", tags=["Plans"])
+router = APIRouter(prefix="/plans", tags=["Plans"], route_class=ProfiledRoute)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -23,6 +31,16 @@ class PlanUpdate(BaseModel):
     description: Optional[str] = None
     due_date: Optional[datetime] = None
 
+def plan_to_out(plan: Plan) -> PlanOut:
+    return PlanOut(
+        id=plan.id,
+        title=plan.title,
+        description=plan.description,
+        created_at=plan.created_at,
+        due_date=plan.due_date,
+        is_completed=bool(plan.is_completed)
+    )
+
 def get_current_user(token: str = Header(None), db: Session = Depends(get_db)):
     logger.debug("Retrieving current user from token.")
     try:
@@ -50,32 +68,60 @@ def get_current_user(token: str = Header(None), db: Session = Depends(get_db)):
         logger.error(f"Error retrieving user from token: {e}", exc_info=True)
         return None
 
-@router.post("/", response_model=PlanOut)
+@router.post("/", response_model=PlanCreateOut)
 def create_plan(
     plan: PlanCreate,
     db: Session = Depends(get_db),
-    token: str = Header(None)
+    token: str = Header(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
     logger.debug(f"Creating plan: {plan.title}")
     try:
-        user = get_current_user(token, db)
-        if not user:
-            logger.warning("Unauthorized attempt to create a plan.")
-            raise HTTPException(status_code=401, detail="Not authenticated")
+        scope = idempotency_store.make_scope("POST", "/plans/", token)
+        with idempotency_store.guard(db, idempotency_key, scope, plan) as guard:
+            if guard.replay is not None:
+                logger.info("Replaying stored response for plan creation.")
+                return guard.replay
 
-        new_plan = Plan(
-            user_id=user.id,
-            title=plan.title,
-            description=plan.description,
-            created_at=datetime.now(timezone.utc),
-            due_date=plan.due_date,
-            is_completed=False  # Add explicit default
-        )
-        db.add(new_plan)
-        db.commit()
-        db.refresh(new_plan)
-        logger.info(f"Plan created successfully: {new_plan.title} by user {user.email}")
-        return new_plan
+            user = get_current_user(token, db)
+            if not user:
+                logger.warning("Unauthorized attempt to create a plan.")
+                raise HTTPException(status_code=401, detail="Not authenticated")
+
+            # Check for near-duplicates before the new plan joins the index.
+            embedding = vector_store.embed_plan(plan.title, plan.description)
+            duplicates = vector_store.possible_duplicates(db, user.id, embedding)
+
+            new_plan = Plan(
+                user_id=user.id,
+                title=plan.title,
+                description=plan.description,
+                created_at=datetime.now(timezone.utc),
+                due_date=plan.due_date,
+                is_completed=False,  # Add explicit default
+                embedding=encode_embedding(embedding)
+            )
+            db.add(new_plan)
+            db.flush()
+            db.refresh(new_plan)
+            version = plan_stats.record_create(db, new_plan)
+            plan_out = PlanCreateOut(
+                id=new_plan.id,
+                title=new_plan.title,
+                description=new_plan.description,
+                created_at=new_plan.created_at,
+                due_date=new_plan.due_date,
+                is_completed=new_plan.is_completed,
+                possible_duplicates=duplicates
+            )
+            guard.record(plan_out)
+            db.commit()
+            vector_store.on_upsert(user.id, new_plan.id, embedding)
+            plan_cache.on_create(user.id, version, plan_to_out(new_plan))
+            if duplicates:
+                logger.info(f"Plan {new_plan.id} has {len(duplicates)} possible duplicates.")
+            logger.info(f"Plan created successfully: {new_plan.title} by user {user.email}")
+            return plan_out
     except HTTPException as he:
         logger.error(f"HTTPException: {he.detail}")
         raise he
@@ -95,9 +141,23 @@ def get_plans(
             logger.warning("Unauthorized attempt to fetch plans.")
             raise HTTPException(status_code=401, detail="Not authenticated")
 
-        plans = db.query(Plan).filter(Plan.user_id == user.id).all()
+        # Read the version before the plans so a cached body is never
+        # stamped with a newer version than its contents.
+        version = plan_stats.get_version(db, user.id)
+        cached = plan_cache.get(user.id, version)
+        if cached is not None:
+            logger.info(f"Serving cached plans ({cached.tier}) for user {user.email}.")
+            return Response(
+                content=cached.body,
+                media_type="application/json",
+                headers={"X-Cache": cached.tier, "X-Cache-Age": f"{cached.age:.3f}"}
+            )
+
+        plans = db.query(Plan).filter(Plan.user_id == user.id).order_by(Plan.id).all()
+        body = encode_json([plan_to_out(p) for p in plans])
+        plan_cache.put(user.id, version, body, last_id=plans[-1].id if plans else 0)
         logger.info(f"Fetched {len(plans)} plans for user {user.email}.")
-        return plans
+        return Response(content=body, media_type="application/json", headers={"X-Cache": "MISS"})
     except HTTPException as he:
         logger.error(f"HTTPException: {he.detail}")
         raise he
@@ -105,6 +165,122 @@ def get_plans(
         logger.error(f"Error fetching plans: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/stats", response_model=PlanStatsOut)
+def get_plan_stats(
+    db: Session = Depends(get_db),
+    token: str = Header(None)
+):
+    logger.debug("Fetching plan stats.")
+    try:
+        user = get_current_user(token, db)
+        if not user:
+            logger.warning("Unauthorized attempt to fetch plan stats.")
+            raise HTTPException(status_code=401, detail="Not authenticated")
+
+        stats = plan_stats.get_stats(db, user.id)
+        logger.info(f"Fetched plan stats for user {user.email}.")
+        return stats
+    except HTTPException as he:
+        logger.error(f"HTTPException: {he.detail}")
+        raise he
+    except Exception as e:
+        logger.error(f"Error fetching plan stats: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/search", response_model=PlanSearchResults)
+def search_plans(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    token: str = Header(None)
+):
+    logger.debug(f"Searching plans: {q}")
+    try:
+        user = get_current_user(token, db)
+        if not user:
+            logger.warning("Unauthorized attempt to search plans.")
+            raise HTTPException(status_code=401, detail="Not authenticated")
+
+        # Fetch one extra row to know whether another page exists.
+        rows = plan_search.search_plans(db, user.id, q, limit + 1, offset)
+        logger.info(f"Found {min(len(rows), limit)} plans matching search for user {user.email}.")
+        return {
+            "results": rows[:limit],
+            "limit": limit,
+            "offset": offset,
+            "has_more": len(rows) > limit,
+        }
+    except HTTPException as he:
+        logger.error(f"HTTPException: {he.detail}")
+        raise he
+    except Exception as e:
+        logger.error(f"Error searching plans: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/import", response_model=PlanImportResult)
+def import_plans(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv or ics; detected from the file name if omitted"),
+    db: Session = Depends(get_db),
+    token: str = Header(None)
+):
+    logger.debug(f"Importing plans from {file.filename}")
+    try:
+        user = get_current_user(token, db)
+        if not user:
+            logger.warning("Unauthorized attempt to import plans.")
+            raise HTTPException(status_code=401, detail="Not authenticated")
+
+        fmt = plan_import.detect_format(file.filename, file.content_type, format)
+        # The upload is spooled by Starlette; read it back line by line.
+        stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        try:
+            result = plan_import.import_plans(db, user.id, stream, fmt)
+        finally:
+            stream.detach()
+        logger.info(f"Imported {result.imported} plans for user {user.email} ({result.failed} failed).")
+        return result.to_dict()
+    except plan_import.ImportFormatError as e:
+        logger.warning(f"Rejected plan import: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException as he:
+        logger.error(f"HTTPException: {he.detail}")
+        raise he
+    except Exception as e:
+        logger.error(f"Error importing plans: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/{plan_id}/similar", response_model=list[SimilarPlan])
+def get_similar_plans(
+    plan_id: int,
+    limit: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db),
+    token: str = Header(None)
+):
+    logger.debug(f"Fetching plans similar to: {plan_id}")
+    try:
+        user = get_current_user(token, db)
+        if not user:
+            logger.warning("Unauthorized attempt to fetch similar plans")
+            raise HTTPException(status_code=401, detail="Not authenticated")
+
+        plan = db.query(Plan).filter(Plan.id == plan_id, Plan.user_id == user.id).first()
+        if not plan:
+            logger.warning(f"Plan not found or unauthorized: {plan_id}")
+            raise HTTPException(status_code=404, detail="Plan not found")
+
+        embedding = vector_store.embed_plan(plan.title, plan.description)
+        similar = vector_store.similar(db, user.id, embedding, k=limit, exclude_id=plan.id)
+        logger.info(f"Found {len(similar)} plans similar to {plan_id}.")
+        return similar
+    except HTTPException as he:
+        logger.error(f"HTTPException: {he.detail}")
+        raise he
+    except Exception as e:
+        logger.error(f"Error fetching similar plans: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.patch("/{plan_id}", response_model=PlanOut)
 def update_plan(
     plan_id: int,
@@ -124,16 +300,31 @@ def update_plan(
             logger.warning(f"Plan not found or unauthorized: {plan_id}")
             raise HTTPException(status_code=404, detail="Plan not found")
 
+        was_completed = bool(plan.is_completed)
         if plan_update.is_completed is not None:
             plan.is_completed = plan_update.is_completed
+            if plan.is_completed and not was_completed:
+                plan.completed_at = datetime.now(timezone.utc)
+            elif not plan.is_completed:
+                plan.completed_at = None
         if plan_update.title is not None:
             plan.title = plan_update.title
         if plan_update.description is not None:
             plan.description = plan_update.description
+        embedding = None
+        if plan_update.title is not None or plan_update.description is not None:
+            embedding = vector_store.embed_plan(plan.title, plan.description)
+            plan.embedding = encode_embedding(embedding)
         if plan_update.due_date is not None:
+            if plan_update.due_date != plan.due_date:
+                plan.last_reminded_at = None  # Re-arm reminders for the new due date
             plan.due_date = plan_update.due_date
 
+        version = plan_stats.record_update(db, plan, was_completed)
         db.commit()
+        plan_cache.on_change(user.id, version)
+        if embedding is not None:
+            vector_store.on_upsert(user.id, plan.id, embedding)
         db.refresh(plan)
         logger.info(f"Plan updated successfully: {plan.title}")
         return plan
@@ -163,7 +354,10 @@ def delete_plan(
             raise HTTPException(status_code=404, detail="Plan not found")
 
         db.delete(plan)
+        version = plan_stats.record_delete(db, plan)
         db.commit()
+        plan_cache.on_change(user.id, version)
+        vector_store.on_delete(user.id, plan_id)
         logger.info(f"Plan deleted successfully: {plan_id}")
         return {"message": "Plan deleted successfully"}
     except HTTPException as he:
@@ -1,8 +1,8 @@
 
 # filepath: /Ubuntu/home/gamikarudev/projects/pyhton-projects/my-planner-ai-app/server/schemas.py
 from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict
-from datetime import datetime
+from typing import Optional, Dict, List
+from datetime import datetime, date
 
 import logging
 
@@ -42,6 +42,44 @@ class PlanOut(BaseModel):
     class Config:
         orm_mode = True
 
+class SimilarPlan(BaseModel):
+    id: int
+    title: str
+    score: float
+
+class PlanCreateOut(PlanOut):
+    possible_duplicates: List[SimilarPlan] = []
+
+class PlanSearchHit(PlanOut):
+    rank: float
+
+class PlanSearchResults(BaseModel):
+    results: List[PlanSearchHit]
+    limit: int
+    offset: int
+    has_more: bool
+
+class PlanStatsOut(BaseModel):
+    total_plans: int
+    completed_plans: int
+    pending_plans: int
+    overdue_plans: int
+    completion_rate: float
+    current_streak: int
+    longest_streak: int
+    last_completion_date: Optional[date]
+
+class PlanImportError(BaseModel):
+    line: int
+    error: str
+
+class PlanImportResult(BaseModel):
+    imported: int
+    failed: int
+    chunks: int
+    errors: List[PlanImportError]
+    errors_truncated: bool
+
 class QuestionnaireResponseBase(BaseModel):
     responses: Dict[str, str]
 
@@ -0,0 +1,61 @@
+# server/tests/conftest.py
+# Shared fixtures. Tests run against a throwaway SQLite database; every test
+# gets its own user so the process-wide caches never see another test's data.
+
+import os
+import sys
+import tempfile
+import uuid
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("JWT_SECRET", "test-secret-key-with-at-least-32-bytes")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from models import User, init_db
+from routers import plans
+from routers.auth import create_access_token
+
+logging.disable(logging.INFO)
+init_db()
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = FastAPI()
+    app.include_router(plans.router)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = User(email=f"user-{uuid.uuid4().hex[:12]}@example.com", hashed_password="x", is_active=True)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@pytest.fixture
+def headers(user):
+    return {"token": create_access_token({"sub": user.email})}
@@ -0,0 +1,221 @@
+# server/tests/test_ai_gateway.py
+# Drives AIGateway against benchmarks/fake_openai.py on a local port.
+
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from ai_gateway import (
+    AIGateway,
+    CircuitBreaker,
+    FAST,
+    GatewayError,
+    LARGE,
+    ModelLane,
+    SUMMARY_SYSTEM_PROMPT,
+    TokenCounter,
+    TRIM_MARKER,
+)
+from benchmarks import fake_openai
+from config import AI_SUMMARY_BATCH_MAX_PLANS
+
+
+@pytest.fixture
+def fake_server():
+    state = fake_openai.FakeOpenAIState(latency=0.0, jitter=0.0, fail_rate=0.0, hang_rate=0.0, hang_seconds=0.0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fake_openai.make_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/v1", state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_gateway(base_url=None, fast_tokens=8000, large_tokens=32000, fast_concurrency=4, breaker_failures=2,
+                 reset_seconds=30.0, large_prompt_tokens=2000, acquire_timeout=1.0):
+    client = openai.OpenAI(api_key="test", base_url=base_url, max_retries=0, timeout=5) if base_url else None
+    return AIGateway(
+        fast=ModelLane(FAST, "fast-model", fast_tokens, fast_concurrency, CircuitBreaker(breaker_failures, reset_seconds)),
+        large=ModelLane(LARGE, "large-model", large_tokens, 2, CircuitBreaker(breaker_failures, reset_seconds)),
+        client=client,
+        large_prompt_tokens=large_prompt_tokens,
+        acquire_timeout=acquire_timeout,
+    )
+
+
+def test_chat_through_fake_server(fake_server):
+    url, state = fake_server
+    gateway = make_gateway(url)
+    result = gateway.chat("Plan my week")
+    assert result["model"] == "fast-model"
+    assert result["reply"].startswith("[fast-model]")
+    assert state.snapshot()["by_model"] == {"fast-model": 1}
+
+
+def test_breaker_open_half_open_closed():
+    breaker = CircuitBreaker(failures=2, reset_seconds=0.05)
+    assert breaker.allow() == "closed"
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is None
+
+    time.sleep(0.06)
+    assert breaker.allow() == "probe"
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is None  # Only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN  # A failed probe re-opens at once
+
+    time.sleep(0.06)
+    assert breaker.allow() == "probe"
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() == "closed"
+
+
+def test_failing_upstream_opens_breaker_and_falls_back(fake_server):
+    url, state = fake_server
+    gateway = make_gateway(url, breaker_failures=2, reset_seconds=0.2)
+    fast, large = gateway.lanes[FAST], gateway.lanes[LARGE]
+
+    state.fail_rate = 1.0
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            gateway.chat("hello")
+    assert fast.breaker.state == CircuitBreaker.OPEN
+
+    state.fail_rate = 0.0
+    assert gateway.chat("hello")["model"] == "large-model"
+    assert gateway.stats()["fallbacks"] == 1
+    assert fast.stats()["rejected_open"] == 1
+
+    time.sleep(0.25)
+    assert gateway.chat("hello")["model"] == "fast-model"  # Half-open probe succeeds
+    assert fast.breaker.state == CircuitBreaker.CLOSED
+    assert large.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_all_breakers_open_is_503():
+    gateway = make_gateway(breaker_failures=1)
+    for lane in gateway.lanes.values():
+        lane.breaker.record_failure()
+    with pytest.raises(GatewayError) as excinfo:
+        gateway.chat("hello")
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.retry_after >= 1
+
+
+def test_busy_lane_is_503_with_retry_after():
+    lane = ModelLane(FAST, "fast-model", 8000, 1, CircuitBreaker())
+    started, release = threading.Event(), threading.Event()
+
+    def slow_create(model):
+        started.set()
+        release.wait(5)
+        return SimpleNamespace(usage=None)
+
+    worker = threading.Thread(target=lane.call, args=(slow_create, 1.0))
+    worker.start()
+    assert started.wait(5)
+    try:
+        with pytest.raises(GatewayError) as excinfo:
+            lane.call(slow_create, 0.05)
+        assert (excinfo.value.status_code, excinfo.value.retry_after) == (503, 1)
+        assert lane.stats()["rejected_busy"] == 1
+    finally:
+        release.set()
+        worker.join()
+    assert lane.stats()["in_flight"] == 0
+
+
+def test_busy_probe_is_given_back():
+    lane = ModelLane(FAST, "fast-model", 8000, 1, CircuitBreaker(failures=1, reset_seconds=0))
+    lane.breaker.record_failure()
+    assert lane.breaker.allow() == "probe"
+    assert lane._slots.acquire(timeout=0)  # Another request holds the only slot
+    try:
+        with pytest.raises(GatewayError):
+            lane.call(lambda model: None, 0.01, probe=True)
+    finally:
+        lane._slots.release()
+    assert lane.breaker.allow() == "probe"
+
+
+def test_route_prefers_lane_by_prompt_size():
+    gateway = make_gateway(fast_tokens=1000, large_prompt_tokens=500)
+    fast, large = gateway.lanes[FAST], gateway.lanes[LARGE]
+    assert gateway.route(100) == [fast, large]
+    assert gateway.route(800) == [large, fast]  # Long, but the fast lane can still take it
+    assert gateway.route(5000) == [large]  # Too long for the fast lane untrimmed
+    assert gateway.route(5000, tier=FAST) == [fast, large]
+
+
+def test_prompt_is_trimmed_to_lane_budget(fake_server):
+    url, state = fake_server
+    gateway = make_gateway(url, fast_tokens=100, large_tokens=200, large_prompt_tokens=50)
+    prompt = "start " + "word " * 2000 + " end"
+    result = gateway.chat(prompt)
+    assert result["model"] == "large-model"
+    assert gateway.stats()["trimmed_prompts"] == 1
+
+    sent = int(result["reply"].split(" a ")[1].split("-")[0])
+    assert sent < len(prompt)
+    assert gateway.counter.count("x" * sent) <= 200
+
+
+def test_trim_keeps_start_and_end():
+    counter = TokenCounter()
+    text = "BEGIN " + "filler " * 500 + "FINISH"
+    trimmed = counter.trim(text, 50)
+    assert counter.count(trimmed) <= 50 + counter.count(TRIM_MARKER)
+    assert trimmed.startswith("BEGIN") and trimmed.endswith("FINISH")
+    assert TRIM_MARKER in trimmed
+    assert counter.trim("short", 50) == "short"
+
+
+def test_pack_batches_respects_plan_cap_and_token_budget():
+    gateway = make_gateway(fast_tokens=400)
+    short = [(i, f"{i}: task") for i in range(100)]
+    batches = gateway.pack_batches(short)
+    assert [plan_id for batch in batches for plan_id, _ in batch] == list(range(100))
+    assert max(len(batch) for batch in batches) == AI_SUMMARY_BATCH_MAX_PLANS
+    assert all(len(batch) <= 3 for batch in gateway.pack_batches(short, max_plans=3))
+
+    long = [(i, f"{i}: " + "task " * 20) for i in range(20)]
+    budget = 400 - gateway.counter.count_messages([
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": ""},
+    ])
+    batches = gateway.pack_batches(long, max_plans=100)
+    assert len(batches) > 1
+    assert all(sum(gateway.counter.count(line) + 1 for _, line in batch) <= budget for batch in batches)
+    assert [plan_id for batch in batches for plan_id, _ in batch] == list(range(20))
+
+
+def test_summarize_plans_batches_through_fake_server(fake_server):
+    url, state = fake_server
+    gateway = make_gateway(url)
+    plans = [SimpleNamespace(id=i, title=f"Plan {i}", description=None, due_date=None, is_completed=False)
+             for i in range(1, 8)]
+    result = gateway.summarize_plans(plans)
+    assert [s["plan_id"] for s in result["summaries"]] == list(range(1, 8))
+    assert result["missing"] == []
+    assert result["models"] == ["fast-model"]
+    assert state.snapshot()["requests"] == result["batches"]
+
+
+def test_parse_summaries_ignores_unknown_ids_and_bad_json():
+    gateway = make_gateway()
+    text = json.dumps({"summaries": [{"id": 1, "summary": " One "}, {"id": 9, "summary": "Other"}, {"id": 2}]})
+    assert gateway._parse_summaries(text, {1, 2}) == {1: "One"}
+    assert gateway._parse_summaries("not json", {1}) == {}
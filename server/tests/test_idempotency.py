@@ -0,0 +1,183 @@
+# server/tests/test_idempotency.py
+
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from idempotency import IdempotencyStore, REPLAYED_HEADER, idempotency_store
+from models import IdempotencyKey, Plan
+from routers import plans as plans_router
+
+
+@pytest.fixture
+def handler_calls(monkeypatch):
+    """Count (and optionally slow down) runs of the create_plan handler body."""
+    calls = {"count": 0, "delay": 0.0}
+    original = plans_router.vector_store.possible_duplicates
+
+    def possible_duplicates(*args, **kwargs):
+        calls["count"] += 1
+        time.sleep(calls["delay"])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(plans_router.vector_store, "possible_duplicates", possible_duplicates)
+    return calls
+
+
+def post_plan(client, headers, key, title="Write report"):
+    return client.post("/plans/", json={"title": title}, headers={**headers, "Idempotency-Key": key})
+
+
+def plan_count(db, user):
+    db.expire_all()
+    return db.query(Plan).filter(Plan.user_id == user.id).count()
+
+
+def test_replay_skips_handler(client, headers, db, user, handler_calls):
+    key = uuid.uuid4().hex
+    first = post_plan(client, headers, key)
+    second = post_plan(client, headers, key)
+    assert first.status_code == second.status_code == 200
+    assert second.headers[REPLAYED_HEADER] == "true"
+    assert REPLAYED_HEADER not in first.headers
+    assert second.json() == first.json()
+
+    # Replays from the database once the front cache is gone.
+    idempotency_store.clear_cache()
+    third = post_plan(client, headers, key)
+    assert third.json() == first.json()
+    assert third.headers[REPLAYED_HEADER] == "true"
+
+    assert handler_calls["count"] == 1
+    assert plan_count(db, user) == 1
+
+
+def test_mismatched_payload_is_rejected(client, headers, db, user):
+    key = uuid.uuid4().hex
+    assert post_plan(client, headers, key, title="First").status_code == 200
+    assert post_plan(client, headers, key, title="Second").status_code == 422
+    idempotency_store.clear_cache()
+    assert post_plan(client, headers, key, title="Second").status_code == 422
+    assert plan_count(db, user) == 1
+
+
+def test_failed_handler_releases_claim(client, headers, db, user, monkeypatch, handler_calls):
+    key = uuid.uuid4().hex
+    original = plans_router.plan_stats.record_create
+
+    def fail_once(*args, **kwargs):
+        monkeypatch.setattr(plans_router.plan_stats, "record_create", original)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(plans_router.plan_stats, "record_create", fail_once)
+    assert post_plan(client, headers, key).status_code == 500
+    assert plan_count(db, user) == 0
+    assert db.query(IdempotencyKey).filter(IdempotencyKey.key == key).count() == 0
+
+    retry = post_plan(client, headers, key)
+    assert retry.status_code == 200
+    assert REPLAYED_HEADER not in retry.headers
+    assert handler_calls["count"] == 2
+    assert plan_count(db, user) == 1
+
+
+def test_concurrent_duplicates_run_handler_once(app, headers, db, user, handler_calls):
+    handler_calls["delay"] = 0.3
+    key = uuid.uuid4().hex
+    responses = []
+
+    def send():
+        responses.append(post_plan(TestClient(app), headers, key))
+
+    threads = [threading.Thread(target=send) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert sum(r.headers.get(REPLAYED_HEADER) == "true" for r in responses) == 2
+    assert handler_calls["count"] == 1
+    assert plan_count(db, user) == 1
+
+
+def test_unrelated_keys_do_not_wait_on_each_other():
+    store = IdempotencyStore(ttl_seconds=60, lock_timeout_seconds=5, cache_size=10)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow_request():
+        db = SessionLocal()
+        try:
+            with store.guard(db, "slow", "scope", {"n": 1}):
+                entered.set()
+                release.wait(5)
+        finally:
+            db.close()
+
+    slow = threading.Thread(target=slow_request)
+    slow.start()
+    try:
+        assert entered.wait(5)
+        db = SessionLocal()
+        try:
+            started = time.time()
+            for i in range(256):  # Enough keys that some would have shared a lock stripe with "slow"
+                with store.guard(db, f"other-{i}", "scope", {"n": i}) as guard:
+                    assert guard.replay is None
+            assert time.time() - started < 4
+        finally:
+            db.close()
+    finally:
+        release.set()
+        slow.join()
+
+
+def test_abandoned_claim_is_taken_over_once():
+    store = IdempotencyStore(ttl_seconds=3600, lock_timeout_seconds=1, cache_size=10, abandon_seconds=5)
+    key, scope = uuid.uuid4().hex, "POST /plans/:test"
+    request_hash = store.hash_payload({"title": "x"})
+    stale = datetime.utcnow() - timedelta(seconds=60)
+
+    db = SessionLocal()
+    db.add(IdempotencyKey(key=key, scope=scope, request_hash=request_hash, status="in_progress",
+                          created_at=stale, expires_at=stale + timedelta(hours=1)))
+    db.commit()
+    db.close()
+
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        claim, entry = store._claim(first, key, scope, request_hash)
+        assert claim is not None and entry is None
+        # The takeover refreshed created_at, so a second waiter now sees a live claim.
+        with pytest.raises(HTTPException) as exc:
+            store._claim(second, key, scope, request_hash)
+        assert exc.value.status_code == 409
+    finally:
+        first.close()
+        second.close()
+
+
+def test_recent_claim_is_not_taken_over():
+    store = IdempotencyStore(ttl_seconds=3600, lock_timeout_seconds=1, cache_size=10, abandon_seconds=600)
+    key, scope = uuid.uuid4().hex, "POST /plans/:test"
+    request_hash = store.hash_payload({"title": "x"})
+    slow = datetime.utcnow() - timedelta(seconds=60)  # Slower than the wait timeout, but healthy
+
+    db = SessionLocal()
+    try:
+        db.add(IdempotencyKey(key=key, scope=scope, request_hash=request_hash, status="in_progress",
+                              created_at=slow, expires_at=slow + timedelta(hours=1)))
+        db.commit()
+        with pytest.raises(HTTPException) as exc:
+            store._claim(db, key, scope, request_hash)
+        assert exc.value.status_code == 409
+    finally:
+        db.close()
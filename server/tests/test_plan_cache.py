@@ -0,0 +1,149 @@
+# server/tests/test_plan_cache.py
+
+import json
+
+import pytest
+
+from plan_cache import PlanListCache, encode_json, plan_cache
+from schemas import PlanOut
+
+
+def get_plans(client, headers):
+    response = client.get("/plans/", headers=headers)
+    assert response.status_code == 200
+    return response
+
+
+def as_plan_out(plan_id):
+    return PlanOut(id=plan_id, title=f"Plan {plan_id}", description=None, created_at=None, due_date=None)
+
+
+def fresh_body(client, headers, user):
+    plan_cache._drop_local(user.id)
+    response = get_plans(client, headers)
+    assert response.headers["X-Cache"] == "MISS"
+    return response.content
+
+
+def test_repeat_reads_hit_local_tier(client, headers, user):
+    client.post("/plans/", json={"title": "A"}, headers=headers)
+    first = get_plans(client, headers)
+    second = get_plans(client, headers)
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "L1"
+    assert second.content == first.content
+
+
+def test_create_patches_cached_list(client, headers, user):
+    client.post("/plans/", json={"title": "A", "description": "first"}, headers=headers)
+    get_plans(client, headers)  # Warm the cache
+    client.post("/plans/", json={"title": "B", "due_date": "2030-01-01T09:30:00"}, headers=headers)
+
+    patched = get_plans(client, headers)
+    assert patched.headers["X-Cache"] == "L1"
+    assert [p["title"] for p in patched.json()] == ["A", "B"]
+    # The patched bytes are exactly what a rebuild from the database produces.
+    assert patched.content == fresh_body(client, headers, user)
+
+
+def test_create_into_empty_list_is_patched(client, headers, user):
+    assert get_plans(client, headers).json() == []
+    client.post("/plans/", json={"title": "Only"}, headers=headers)
+    patched = get_plans(client, headers)
+    assert patched.headers["X-Cache"] == "L1"
+    assert patched.content == fresh_body(client, headers, user)
+
+
+@pytest.mark.parametrize("change", ["update", "delete"])
+def test_updates_and_deletes_invalidate(client, headers, user, change):
+    plan_id = client.post("/plans/", json={"title": "A"}, headers=headers).json()["id"]
+    client.post("/plans/", json={"title": "B"}, headers=headers)
+    get_plans(client, headers)
+    if change == "update":
+        client.patch(f"/plans/{plan_id}", json={"title": "A2", "is_completed": True}, headers=headers)
+    else:
+        client.delete(f"/plans/{plan_id}", headers=headers)
+
+    after = get_plans(client, headers)
+    assert after.headers["X-Cache"] == "MISS"
+    titles = [p["title"] for p in after.json()]
+    assert titles == (["A2", "B"] if change == "update" else ["B"])
+
+
+def test_stale_version_is_never_served():
+    cache = PlanListCache(max_entries=10, max_bytes=10_000, max_entry_bytes=1_000)
+    cache.put(1, 5, b"[]", last_id=0)
+    assert cache.get(1, 6) is None
+    assert cache.get(1, 5) is None  # The stale entry was evicted on the mismatch
+    assert cache.stats()["stale_evictions"] == 1
+
+
+def test_patch_requires_next_version_and_last_position():
+    cache = PlanListCache(max_entries=10, max_bytes=10_000, max_entry_bytes=1_000)
+    body = encode_json([as_plan_out(3)])
+
+    cache.put(1, 1, body, last_id=3)
+    cache.on_create(1, 2, as_plan_out(4))
+    assert [p["id"] for p in json.loads(cache.get(1, 2).body)] == [3, 4]
+    assert cache.get(1, 2).body == encode_json([as_plan_out(3), as_plan_out(4)])
+
+    # A version gap (another write happened in between) must not be patched.
+    cache.on_create(1, 4, as_plan_out(5))
+    assert cache.get(1, 4) is None
+
+    # A plan that would not sort last must not be appended.
+    cache.put(1, 5, body, last_id=3)
+    cache.on_create(1, 6, as_plan_out(2))
+    assert cache.get(1, 6) is None
+    assert cache.stats()["patches"] == 1
+
+
+def test_byte_limits_evict_oldest_entries():
+    cache = PlanListCache(max_entries=10, max_bytes=25, max_entry_bytes=12)
+    cache.put(1, 1, b"[" + b"1" * 9 + b"]")
+    cache.put(2, 1, b"[" + b"2" * 9 + b"]")
+    cache.put(3, 1, b"[" + b"3" * 9 + b"]")
+    assert cache.get(1, 1) is None
+    assert cache.get(3, 1) is not None
+    cache.put(4, 1, b"[" + b"4" * 20 + b"]")  # Larger than max_entry_bytes: not cached
+    assert cache.get(4, 1) is None
+
+
+class FakeSharedTier:
+    """In-process stand-in for the Redis shared tier and pub/sub bus."""
+
+    def __init__(self):
+        self.values = {}
+        self.handlers = []
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ttl_seconds):
+        self.values[key] = value
+
+    def publish(self, channel, message):
+        for handler in self.handlers:
+            handler(message)
+
+    def subscribe(self, channel, handler):
+        self.handlers.append(handler)
+        return None
+
+
+def test_shared_tier_and_broadcast_invalidation():
+    shared = FakeSharedTier()
+    worker_a = PlanListCache(10, 10_000, 1_000, shared=shared)
+    worker_b = PlanListCache(10, 10_000, 1_000, shared=shared)
+    worker_a.start()
+    worker_b.start()
+
+    worker_a.put(7, 1, b"[]", last_id=0)
+    from_shared = worker_b.get(7, 1)
+    assert from_shared.tier == "L2" and from_shared.body == b"[]"
+    assert worker_b.get(7, 1).tier == "L1"
+
+    # A write on worker A evicts worker B's older copy.
+    worker_a.on_change(7, 2)
+    assert 7 not in worker_b._entries
+    assert worker_b.stats()["broadcasts_received"] >= 1
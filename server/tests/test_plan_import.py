@@ -0,0 +1,37 @@
+# server/tests/test_plan_import.py
+
+import io
+from datetime import datetime
+
+import numpy as np
+
+import plan_import
+from models import Plan
+from plan_vectors import decode, vector_store
+
+
+def test_import_stores_embeddings(db, user):
+    stream = io.StringIO("title,description\nBuy milk,From the shop\nCall mom,\n,missing title\n")
+    result = plan_import.import_plans(db, user.id, stream, plan_import.CSV_FORMAT, chunk_size=1)
+    assert (result.imported, result.failed, result.chunks) == (2, 1, 2)
+
+    db.expire_all()
+    plans = db.query(Plan).filter(Plan.user_id == user.id).order_by(Plan.id).all()
+    assert [p.title for p in plans] == ["Buy milk", "Call mom"]
+    for plan in plans:
+        expected = vector_store.embed_plan(plan.title, plan.description)
+        assert np.array_equal(decode(plan.embedding, vector_store.embedder.dim), expected)
+
+
+def test_index_load_persists_missing_embeddings(db, user):
+    plan = Plan(user_id=user.id, title="Water plants", created_at=datetime.utcnow())
+    db.add(plan)
+    db.commit()
+    assert plan.embedding is None
+
+    vector_store.invalidate(user.id)
+    assert len(vector_store.get_index(db, user.id)) == 1
+
+    db.expire_all()
+    expected = vector_store.embed_plan("Water plants", None)
+    assert np.array_equal(decode(db.get(Plan, plan.id).embedding, vector_store.embedder.dim), expected)
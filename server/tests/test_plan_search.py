@@ -0,0 +1,89 @@
+# server/tests/test_plan_search.py
+# Exercises the SQLite FTS5 fallback behind GET /plans/search.
+
+import uuid
+
+from models import User
+from plan_search import _fts5_query
+from routers.auth import create_access_token
+
+
+def search(client, headers, q, **params):
+    response = client.get("/plans/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create(client, headers, title, description=None):
+    response = client.post("/plans/", json={"title": title, "description": description}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_fts5_query_quotes_every_term():
+    assert _fts5_query("buy milk") == '"buy" "milk"*'
+    assert _fts5_query('title:x OR NEAR(a b)') == '"title" "x" "OR" "NEAR" "a" "b"*'
+    assert _fts5_query('"*)(') == ""
+    assert _fts5_query("   ") == ""
+
+
+def test_fts5_syntax_in_query_is_not_injected(client, headers):
+    create(client, headers, "Renew passport")
+    for q in ['"*)(', "passport OR", "NOT passport", "passport*", "title:passport", "a\" OR \"b"]:
+        search(client, headers, q)
+    assert search(client, headers, '"*)(')["results"] == []
+    assert [r["title"] for r in search(client, headers, "title:passport")["results"]] == []
+    assert [r["title"] for r in search(client, headers, "passport OR")["results"]] == []
+
+
+def test_last_term_is_a_prefix_match(client, headers):
+    create(client, headers, "Buy groceries for the week")
+    assert [r["title"] for r in search(client, headers, "groc")["results"]] == ["Buy groceries for the week"]
+    assert [r["title"] for r in search(client, headers, "buy groc")["results"]] == ["Buy groceries for the week"]
+    assert search(client, headers, "groc buy")["results"] == []  # Only the last term is a prefix
+
+
+def test_title_matches_rank_above_description_matches(client, headers):
+    in_description = create(client, headers, "Weekend errands", "drop off the dry cleaning")
+    in_title = create(client, headers, "Cleaning the garage")
+    assert [r["id"] for r in search(client, headers, "cleaning")["results"]] == [in_title, in_description]
+
+
+def test_results_are_limited_to_the_user(client, headers, db):
+    word = "zq" + uuid.uuid4().hex[:8]
+    mine = create(client, headers, f"Mine {word}")
+    other = User(email=f"other-{uuid.uuid4().hex[:12]}@example.com", hashed_password="x", is_active=True)
+    db.add(other)
+    db.commit()
+    other_headers = {"token": create_access_token({"sub": other.email})}
+    theirs = create(client, other_headers, f"Theirs {word}")
+
+    assert [r["id"] for r in search(client, headers, word)["results"]] == [mine]
+    assert [r["id"] for r in search(client, other_headers, word)["results"]] == [theirs]
+
+
+def test_offset_paging_and_has_more(client, headers):
+    ids = {create(client, headers, f"Practice guitar lesson {i}") for i in range(5)}
+    page = search(client, headers, "guitar", limit=2)
+    assert (len(page["results"]), page["has_more"], page["limit"], page["offset"]) == (2, True, 2, 0)
+
+    seen = []
+    for offset in (0, 2, 4):
+        page = search(client, headers, "guitar", limit=2, offset=offset)
+        seen.extend(r["id"] for r in page["results"])
+    assert page["has_more"] is False and len(page["results"]) == 1
+    assert sorted(seen) == sorted(ids)
+
+
+def test_index_follows_updates_and_deletes(client, headers):
+    plan_id = create(client, headers, "Water plants")
+    assert client.patch(f"/plans/{plan_id}", json={"title": "Walk dog"}, headers=headers).status_code == 200
+    assert search(client, headers, "plants")["results"] == []
+    assert [r["id"] for r in search(client, headers, "dog")["results"]] == [plan_id]
+
+    assert client.delete(f"/plans/{plan_id}", headers=headers).status_code in (200, 204)
+    assert search(client, headers, "dog")["results"] == []
+
+
+def test_search_requires_authentication(client):
+    assert client.get("/plans/search", params={"q": "anything"}).status_code == 401
@@ -0,0 +1,146 @@
+# server/tests/test_plan_stats.py
+
+from datetime import date, datetime, timedelta
+
+import plan_stats
+from models import Plan, PlanStats
+
+
+def stored(db, user):
+    db.expire_all()
+    row = db.query(PlanStats).filter(PlanStats.user_id == user.id).one()
+    return {field: getattr(row, field) for field in plan_stats.COUNTER_FIELDS}
+
+
+def add_plan(db, user, completed_on=None):
+    plan = Plan(user_id=user.id, title="Plan", created_at=datetime.utcnow(), is_completed=completed_on is not None,
+                completed_at=datetime.combine(completed_on, datetime.min.time()) if completed_on else None)
+    db.add(plan)
+    db.flush()
+    plan_stats.record_create(db, plan)
+    db.commit()
+    return plan
+
+
+def set_completed(db, plan, completed_on):
+    was_completed = bool(plan.is_completed)
+    plan.is_completed = completed_on is not None
+    plan.completed_at = datetime.combine(completed_on, datetime.min.time()) if completed_on else None
+    plan_stats.record_update(db, plan, was_completed)
+    db.commit()
+
+
+def assert_consistent(db, user):
+    assert stored(db, user) == plan_stats.compute_stats(db, user.id)
+    assert plan_stats.check_consistency(db, user.id) == []
+
+
+def test_api_writes_keep_counters_in_sync(client, headers, db, user):
+    ids = [client.post("/plans/", json={"title": f"Plan {i}"}, headers=headers).json()["id"] for i in range(3)]
+    assert client.patch(f"/plans/{ids[0]}", json={"is_completed": True}, headers=headers).status_code == 200
+    assert client.patch(f"/plans/{ids[1]}", json={"title": "Renamed"}, headers=headers).status_code == 200
+    assert client.delete(f"/plans/{ids[2]}", headers=headers).status_code == 200
+
+    stats = client.get("/plans/stats", headers=headers).json()
+    assert stats["total_plans"] == 2
+    assert stats["completed_plans"] == 1
+    assert stats["pending_plans"] == 1
+    assert stats["completion_rate"] == 0.5
+    assert stats["current_streak"] == 1
+    assert stats["last_completion_date"] == datetime.utcnow().date().isoformat()
+    assert_consistent(db, user)
+
+
+def test_overdue_is_counted_from_plans(client, headers):
+    past = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    future = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    client.post("/plans/", json={"title": "Late", "due_date": past}, headers=headers)
+    client.post("/plans/", json={"title": "Soon", "due_date": future}, headers=headers)
+    assert client.get("/plans/stats", headers=headers).json()["overdue_plans"] == 1
+
+
+def test_every_write_bumps_version(client, headers, db, user):
+    assert plan_stats.get_version(db, user.id) == 0
+    plan_id = client.post("/plans/", json={"title": "A"}, headers=headers).json()["id"]
+    assert plan_stats.get_version(db, user.id) == 1
+    client.patch(f"/plans/{plan_id}", json={"title": "B"}, headers=headers)
+    db.expire_all()
+    assert plan_stats.get_version(db, user.id) == 2
+    client.delete(f"/plans/{plan_id}", headers=headers)
+    db.expire_all()
+    assert plan_stats.get_version(db, user.id) == 3
+
+
+def test_streaks_extend_on_consecutive_days(db, user):
+    start = date(2025, 3, 1)
+    for offset in (0, 1, 2, 4, 5):
+        add_plan(db, user, start + timedelta(days=offset))
+    counters = stored(db, user)
+    assert counters["current_streak"] == 2
+    assert counters["longest_streak"] == 3
+    assert counters["last_completion_date"] == start + timedelta(days=5)
+    # Several completions on one day count once.
+    add_plan(db, user, start + timedelta(days=5))
+    assert stored(db, user)["current_streak"] == 2
+    assert_consistent(db, user)
+
+
+def test_uncompleting_recounts_streaks(db, user):
+    start = date(2025, 3, 1)
+    plans = [add_plan(db, user, start + timedelta(days=offset)) for offset in range(3)]
+    assert stored(db, user)["longest_streak"] == 3
+
+    set_completed(db, plans[1], None)  # Breaks the run in the middle
+    counters = stored(db, user)
+    assert counters["completed_plans"] == 2
+    assert counters["current_streak"] == 1
+    assert counters["longest_streak"] == 1
+    assert_consistent(db, user)
+
+    set_completed(db, plans[1], start + timedelta(days=1))
+    assert stored(db, user)["longest_streak"] == 3
+    assert_consistent(db, user)
+
+
+def test_deleting_completed_plan_recounts_streaks(db, user):
+    start = date(2025, 3, 1)
+    plans = [add_plan(db, user, start + timedelta(days=offset)) for offset in range(2)]
+    add_plan(db, user)
+
+    db.delete(plans[-1])
+    plan_stats.record_delete(db, plans[-1])
+    db.commit()
+    counters = stored(db, user)
+    assert counters["total_plans"] == 2
+    assert counters["completed_plans"] == 1
+    assert counters["current_streak"] == 1
+    assert counters["last_completion_date"] == start
+    assert_consistent(db, user)
+
+
+def test_bulk_create_counts_without_touching_streaks(db, user):
+    add_plan(db, user, date(2025, 3, 1))
+    before = stored(db, user)
+    version = plan_stats.record_bulk_create(db, user.id, total=10, completed=4)
+    db.commit()
+    after = stored(db, user)
+    assert after["total_plans"] == before["total_plans"] + 10
+    assert after["completed_plans"] == before["completed_plans"] + 4
+    assert after["current_streak"] == before["current_streak"]
+    assert version == plan_stats.get_version(db, user.id)
+
+
+def test_check_finds_and_fixes_drift(db, user):
+    add_plan(db, user, date(2025, 3, 1))
+    add_plan(db, user)
+    row = db.query(PlanStats).filter(PlanStats.user_id == user.id).one()
+    row.total_plans = 99
+    row.current_streak = 7
+    db.commit()
+
+    mismatches = plan_stats.check_consistency(db, user.id)
+    assert len(mismatches) == 1
+    assert mismatches[0]["expected"]["total_plans"] == 2
+
+    plan_stats.check_consistency(db, user.id, fix=True)
+    assert_consistent(db, user)
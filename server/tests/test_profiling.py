@@ -0,0 +1,29 @@
+# server/tests/test_profiling.py
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+import profiling
+
+
+def test_failed_statements_do_not_leak_timings():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    profiling.install_sql_hooks(engine)
+    profile = profiling.RequestProfile(1, "GET", "/plans/", "header")
+    token = profiling.current_profile.set(profile)
+    try:
+        for _ in range(3):
+            with engine.connect() as conn:
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing_table"))
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            assert not any("profiling" in str(key) for key in conn.info)
+    finally:
+        profiling.current_profile.reset(token)
+        engine.dispose()
+
+    assert [s["statement"] for s in profile.statements] == ["SELECT 1"]
+    assert profile.statements[0]["duration_ms"] < 1000
@@ -0,0 +1,176 @@
+# server/tests/test_reminders.py
+
+from datetime import datetime, timedelta
+
+import reminders
+from models import Plan
+from database import SessionLocal
+from reminders import OVERDUE, UPCOMING, AdvisoryLeaderLock, ReminderService, next_reminder
+
+LEAD = timedelta(hours=1)
+
+
+class RecordingSink:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append((event.kind, event.plan_id))
+
+
+class RecordingScheduler:
+    def __init__(self):
+        self.jobs = []
+
+    def schedule(self, run_at, key, callback):
+        self.jobs.append(key)
+
+
+class FakeLock:
+    def __init__(self, held=True, acquirable=True):
+        self.held = held
+        self.acquirable = acquirable
+        self.acquires = 0
+
+    def acquire(self):
+        self.acquires += 1
+        self.held = self.acquirable
+        return self.held
+
+    def is_held(self):
+        return self.held
+
+    def release(self):
+        self.held = False
+
+
+def make_service(sink=None, lock=None, batch_size=100):
+    return ReminderService(SessionLocal, [sink or RecordingSink()], lock or FakeLock(),
+                           scheduler=RecordingScheduler(), lead=LEAD, batch_size=batch_size)
+
+
+def add_plan(db, user, due_date, last_reminded_at=None, title="Plan"):
+    plan = Plan(user_id=user.id, title=title, created_at=datetime.utcnow(), due_date=due_date,
+                last_reminded_at=last_reminded_at)
+    db.add(plan)
+    db.commit()
+    return plan
+
+
+def test_next_reminder_transitions():
+    now = datetime(2030, 1, 1, 12, 0)
+    due = now + timedelta(hours=3)
+    assert next_reminder(due, None, now, LEAD) == (UPCOMING, due - LEAD)
+    assert next_reminder(due, None, due - timedelta(minutes=30), LEAD) == (UPCOMING, due - timedelta(minutes=30))
+
+    reminded = due - LEAD
+    assert next_reminder(due, reminded, reminded, LEAD) == (OVERDUE, due)
+    after_due = due + timedelta(minutes=5)
+    assert next_reminder(due, reminded, after_due, LEAD) == (OVERDUE, after_due)
+    assert next_reminder(due, after_due, after_due, LEAD) is None
+
+
+def test_due_date_change_rearms_reminders(client, headers, db, user):
+    due = datetime.utcnow() - timedelta(minutes=1)
+    plan = add_plan(db, user, due, last_reminded_at=datetime.utcnow())
+    assert next_reminder(plan.due_date, plan.last_reminded_at, datetime.utcnow(), LEAD) is None
+
+    new_due = datetime.utcnow() + timedelta(days=1)
+    response = client.patch(f"/plans/{plan.id}", json={"due_date": new_due.isoformat()}, headers=headers)
+    assert response.status_code == 200
+    db.expire_all()
+    plan = db.get(Plan, plan.id)
+    assert plan.last_reminded_at is None
+    assert next_reminder(plan.due_date, plan.last_reminded_at, datetime.utcnow(), LEAD)[0] == UPCOMING
+
+
+def test_iter_due_batches_pages_across_batch_boundary(db, user):
+    # A window far from other tests' plans; several share a due date so the
+    # (due_date, id) cursor has to break ties.
+    now = datetime(2099, 6, 1, 12, 0)
+    due_dates = [now + timedelta(minutes=m) for m in (5, 5, 5, 10, 10, 20, 30)]
+    expected = [add_plan(db, user, due).id for due in due_dates]
+    add_plan(db, user, now + timedelta(minutes=15), last_reminded_at=now + timedelta(minutes=20))  # Already sent
+    add_plan(db, user, now + timedelta(days=2))  # Beyond the horizon
+
+    service = make_service(batch_size=3)
+    batches = list(service.iter_due_batches(db, now))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [row.id for batch in batches for row in batch] == expected
+
+
+def test_fire_emits_once_when_two_workers_race(db, user, monkeypatch):
+    plan = add_plan(db, user, datetime.utcnow() - timedelta(minutes=1))
+    sink = RecordingSink()
+    first, second = make_service(sink), make_service(sink)
+
+    # Let the second worker fire in between the first one reading the plan
+    # and claiming it.
+    original = reminders.next_reminder
+    raced = []
+
+    def racing_next_reminder(*args):
+        action = original(*args)
+        if not raced:
+            raced.append(True)
+            assert second.fire(plan.id) is not None
+        return action
+
+    monkeypatch.setattr(reminders, "next_reminder", racing_next_reminder)
+    assert first.fire(plan.id) is None
+    assert second.fire(plan.id) is None
+    assert sink.events == [(OVERDUE, plan.id)]
+
+
+def test_fire_upcoming_then_overdue(db, user):
+    plan = add_plan(db, user, datetime.utcnow() + timedelta(minutes=30))
+    sink = RecordingSink()
+    service = make_service(sink)
+    assert service.fire(plan.id).kind == UPCOMING
+    assert service.fire(plan.id) is None  # Overdue is only rescheduled until due
+    assert service.scheduler.jobs[-1] == ("plan", plan.id)
+
+    db.query(Plan).filter(Plan.id == plan.id).update({"due_date": datetime.utcnow() - timedelta(seconds=1),
+                                                      "last_reminded_at": datetime.utcnow() - timedelta(minutes=5)})
+    db.commit()
+    assert service.fire(plan.id).kind == OVERDUE
+    assert sink.events == [(UPCOMING, plan.id), (OVERDUE, plan.id)]
+
+
+def test_scan_job_steps_down_when_lock_is_lost(monkeypatch):
+    lock = FakeLock()
+    service = make_service(lock=lock)
+    scans = []
+    monkeypatch.setattr(service, "scan", lambda: scans.append(True))
+
+    service._scan_job()
+    assert service.is_leader and len(scans) == 1
+
+    lock.held, lock.acquirable = False, False
+    service._scan_job()
+    assert not service.is_leader
+    assert len(scans) == 1
+
+    lock.acquirable = True
+    service._scan_job()
+    assert service.is_leader and len(scans) == 2
+    assert service.scheduler.jobs.count("scan") == 3
+
+
+class BrokenConnection:
+    closed = False
+
+    def execute(self, *args, **kwargs):
+        raise ConnectionError("server closed the connection unexpectedly")
+
+    def close(self):
+        self.closed = True
+
+
+def test_advisory_lock_liveness_check_drops_dead_connection():
+    lock = AdvisoryLeaderLock(engine=None)
+    assert not lock.is_held()
+    conn = BrokenConnection()
+    lock._conn = conn
+    assert not lock.is_held()
+    assert conn.closed and lock._conn is None